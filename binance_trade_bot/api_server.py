@@ -1,71 +1,137 @@
+import os
 import re
+import threading
+import time
 from datetime import datetime, timedelta
-from itertools import groupby
-from typing import List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from flask import Flask, jsonify, request
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 
 from .config import Config
 from .database import Database
 from .logger import Logger
-from .models import Coin, CoinValue, CurrentCoin, Pair, ScoutHistory, Trade
+from .models import Coin, CoinStats, CoinValue, CurrentCoin, Pair, PortfolioStats, ScoutHistory, Trade
 
 app = Flask(__name__)
 cors = CORS(app, resources={r"/api/*": {"origins": "*"}})
 
-socketio = SocketIO(app, cors_allowed_origins="*")
+# With a message queue (e.g. redis://redis:6379), several API workers share the broadcasts to the frontend clients.
+# Without one, broadcasts stay within the process.
+socketio = SocketIO(app, cors_allowed_origins="*", message_queue=os.environ.get("SOCKETIO_MESSAGE_QUEUE"))
 
+# Room of the frontend clients that haven't subscribed to specific tables, and get every update
+ALL_TABLES_ROOM = "all"
+# Seconds over which updates are collected for the clients that asked for them in batches
+BATCH_INTERVAL = 1.0
 
-logger = Logger("api_server")
-config = Config()
-db = Database(logger, config)
 
+# A replica that hasn't been refreshed for this long is assumed abandoned, e.g. because the bot stopped writing it
+READ_REPLICA_MAX_AGE = 300
 
-def filter_period(query, model):  # pylint: disable=inconsistent-return-statements
-    period = request.args.get("period", "all")
+_logger = None
+_config = None
+_databases: Dict[Optional[str], Database] = {}
+_db_lock = threading.Lock()
+
+
+def get_db() -> Database:
+    # Built on the first request rather than at import time, so that workers come up right away
+    global _logger, _config  # pylint: disable=global-statement
+    with _db_lock:
+        if _config is None:
+            _logger = Logger("api_server")
+            _config = Config()
+
+        # Read from the replica written by the bot when there is a recent one, so dashboard queries never contend
+        # with the bot's writes
+        uri = None
+        replica_path = _config.READ_REPLICA_PATH
+        if os.path.isfile(replica_path) and time.time() - os.path.getmtime(replica_path) < READ_REPLICA_MAX_AGE:
+            uri = f"sqlite:///file:{replica_path}?mode=ro&uri=true"
+        if uri not in _databases:
+            _databases[uri] = Database(_logger, _config, uri)
+        return _databases[uri]
 
-    if period == "all":
+
+def period_start() -> Optional[datetime]:
+    """
+    Start of the period given in the request, e.g. `?period=12h`, or None for all of it
+    """
+    period = request.args.get("period", "all")
+    match = re.fullmatch(r"(\d*)([shdwm])", period)
+    if match is None:
+        return None
+
+    num = float(match.group(1) or 1)
+    unit = match.group(2)
+    if unit == "s":
+        return datetime.now() - timedelta(seconds=num)
+    if unit == "h":
+        return datetime.now() - timedelta(hours=num)
+    if unit == "d":
+        return datetime.now() - timedelta(days=num)
+    if unit == "w":
+        return datetime.now() - timedelta(weeks=num)
+    return datetime.now() - timedelta(days=28 * num)
+
+
+def filter_period(query, model):
+    start = period_start()
+    if start is None:
         return query
+    return query.filter(model.datetime >= start)
 
-    num = float(re.search(r"(\d*)[shdwm]", "1d").group(1))
 
-    if "s" in period:
-        return query.filter(model.datetime >= datetime.now() - timedelta(seconds=num))
-    if "h" in period:
-        return query.filter(model.datetime >= datetime.now() - timedelta(hours=num))
-    if "d" in period:
-        return query.filter(model.datetime >= datetime.now() - timedelta(days=num))
-    if "w" in period:
-        return query.filter(model.datetime >= datetime.now() - timedelta(weeks=num))
-    if "m" in period:
-        return query.filter(model.datetime >= datetime.now() - timedelta(days=28 * num))
+def archived_value_info(point: tuple):
+    timestamp, balance, usd_price, btc_price = point
+    return {
+        "balance": balance,
+        "usd_value": balance * usd_price if usd_price is not None else None,
+        "btc_value": balance * btc_price if btc_price is not None else None,
+        "datetime": timestamp.isoformat(),
+    }
 
 
 @app.route("/api/value_history/<coin>")
 @app.route("/api/value_history")
 def value_history(coin: str = None):
+    # Entries that made it to the value history archive are read from there, at full resolution, the database
+    # only adds the ones after them
+    archive = get_db().value_archive
+    coins = [coin] if coin else archive.coins()
+    start = period_start()
+    history: Dict[str, List[dict]] = {
+        symbol: [archived_value_info(point) for point in archive.read(symbol, start)] for symbol in coins
+    }
+    archived_until = {symbol: archive.last(symbol) for symbol in coins}
+
     session: Session
-    with db.db_session() as session:
+    with get_db().db_session() as session:
         query = session.query(CoinValue).order_by(CoinValue.coin_id.asc(), CoinValue.datetime.asc())
 
         query = filter_period(query, CoinValue)
 
         if coin:
-            values: List[CoinValue] = query.filter(CoinValue.coin_id == coin).all()
-            return jsonify([entry.info() for entry in values])
+            query = query.filter(CoinValue.coin_id == coin)
 
-        coin_values = groupby(query.all(), key=lambda cv: cv.coin)
-        return jsonify({coin.symbol: [entry.info() for entry in history] for coin, history in coin_values})
+        for entry in query.all():
+            last = archived_until.get(entry.coin_id)
+            if last is None or entry.datetime.replace(microsecond=0) > last:
+                history.setdefault(entry.coin_id, []).append(entry.info())
+
+    if coin:
+        return jsonify(history[coin])
+    return jsonify({symbol: history[symbol] for symbol in sorted(history) if history[symbol]})
 
 
 @app.route("/api/total_value_history")
 def total_value_history():
     session: Session
-    with db.db_session() as session:
+    with get_db().db_session() as session:
         query = session.query(
             CoinValue.datetime,
             func.sum(CoinValue.btc_value),
@@ -81,7 +147,7 @@ def total_value_history():
 @app.route("/api/trade_history")
 def trade_history():
     session: Session
-    with db.db_session() as session:
+    with get_db().db_session() as session:
         query = session.query(Trade).order_by(Trade.datetime.asc())
 
         query = filter_period(query, Trade)
@@ -92,10 +158,10 @@ def trade_history():
 
 @app.route("/api/scouting_history")
 def scouting_history():
-    _current_coin = db.get_current_coin()
+    _current_coin = get_db().get_current_coin()
     coin = _current_coin.symbol if _current_coin is not None else None
     session: Session
-    with db.db_session() as session:
+    with get_db().db_session() as session:
         query = (
             session.query(ScoutHistory)
             .join(ScoutHistory.pair)
@@ -111,14 +177,14 @@ def scouting_history():
 
 @app.route("/api/current_coin")
 def current_coin():
-    coin = db.get_current_coin()
+    coin = get_db().get_current_coin()
     return coin.info() if coin else None
 
 
 @app.route("/api/current_coin_history")
 def current_coin_history():
     session: Session
-    with db.db_session() as session:
+    with get_db().db_session() as session:
         query = session.query(CurrentCoin)
 
         query = filter_period(query, CurrentCoin)
@@ -130,8 +196,8 @@ def current_coin_history():
 @app.route("/api/coins")
 def coins():
     session: Session
-    with db.db_session() as session:
-        _current_coin = session.merge(db.get_current_coin())
+    with get_db().db_session() as session:
+        _current_coin = session.merge(get_db().get_current_coin())
         _coins: List[Coin] = session.query(Coin).all()
         return jsonify([{**coin.info(), "is_current": coin == _current_coin} for coin in _coins])
 
@@ -139,14 +205,90 @@ def coins():
 @app.route("/api/pairs")
 def pairs():
     session: Session
-    with db.db_session() as session:
+    with get_db().db_session() as session:
         all_pairs: List[Pair] = session.query(Pair).all()
         return jsonify([pair.info() for pair in all_pairs])
 
 
+@app.route("/api/portfolio")
+def portfolio():
+    session: Session
+    with get_db().db_session() as session:
+        stats: PortfolioStats = session.query(PortfolioStats).get(1)
+        coin_stats: List[CoinStats] = session.query(CoinStats).all()
+        return jsonify(
+            {
+                **(stats.info() if stats is not None else {}),
+                "jumps": sum(coin.jumps for coin in coin_stats),
+                "realized_pnl": sum(coin.realized_pnl for coin in coin_stats),
+                "fees_paid": sum(coin.fees_paid for coin in coin_stats),
+                "coins": [coin.info() for coin in coin_stats],
+            }
+        )
+
+
+_batches: Dict[str, list] = {}
+_batch_lock = threading.Lock()
+_batch_task = None
+
+
+def batch_room(table: str):
+    return f"batch:{table}"
+
+
+def flush_batches():
+    global _batches  # pylint: disable=global-statement
+    while True:
+        socketio.sleep(BATCH_INTERVAL)
+        with _batch_lock:
+            batches, _batches = _batches, {}
+        for table, data in batches.items():
+            socketio.emit("updates", {"table": table, "data": data}, namespace="/frontend", room=batch_room(table))
+
+
+@socketio.on("connect", namespace="/frontend")
+def handle_frontend_connect():
+    join_room(ALL_TABLES_ROOM)
+
+
+@socketio.on("subscribe", namespace="/frontend")
+def handle_subscribe(json):
+    """
+    Only receive the updates of some tables, e.g. {"tables": ["trade_history"], "batch": true}. Batched updates are
+    sent as a single "updates" event with a list of rows every BATCH_INTERVAL seconds, for clients that can't keep up
+    with one event per row.
+    """
+    for room in rooms(namespace="/frontend"):
+        if room != request.sid:
+            leave_room(room)
+    for table in json.get("tables", []):
+        join_room(batch_room(table) if json.get("batch") else table)
+
+
+def relay_rows(table: str, rows: list):
+    global _batch_task  # pylint: disable=global-statement
+    for row in rows:
+        update = {"table": table, "data": row}
+        emit("update", update, namespace="/frontend", room=ALL_TABLES_ROOM)
+        emit("update", update, namespace="/frontend", room=table)
+
+    with _batch_lock:
+        _batches.setdefault(table, []).extend(rows)
+        if _batch_task is None:
+            _batch_task = socketio.start_background_task(flush_batches)
+
+
 @socketio.on("update", namespace="/backend")
 def handle_my_custom_event(json):
-    emit("update", json, namespace="/frontend", broadcast=True)
+    relay_rows(json["table"], [json["data"]])
+
+
+@socketio.on("updates", namespace="/backend")
+def handle_backend_updates(json):
+    """
+    Several rows of a table sent by the bot at once, frontend clients still get one "update" event per row
+    """
+    relay_rows(json["table"], json["data"])
 
 
 if __name__ == "__main__":
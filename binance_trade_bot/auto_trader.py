@@ -1,92 +1,196 @@
+import math
 import random
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
+from sqlalchemy import case
 from sqlalchemy.orm import Session
 
 from .binance_api_manager import BinanceAPIManager
 from .config import Config
 from .database import Database
+from .execution import JumpExecutor
 from .logger import Logger
+from .market import MarketPrices, PairInfo
 from .models import Coin, CoinValue, Pair
-from .utils import get_market_ticker_price_from_list
 
 
 class AutoTrader:
+    # Relative distance of the best pair from its threshold at which the adaptive scout interval is the shortest
+    # and the longest allowed
+    NEAR_THRESHOLD = 0.001
+    FAR_FROM_THRESHOLD = 0.01
+    # Number of price histories fetched at the same time when seeding thresholds from them
+    HISTORY_WORKERS = 8
+    # Seconds the balance of the current coin is reused for when rescoring candidates, it only changes with a jump
+    BALANCE_MAX_AGE = 60
+
     def __init__(self, binance_manager: BinanceAPIManager, database: Database, logger: Logger, config: Config):
         self.manager = binance_manager
         self.db = database
         self.logger = logger
         self.config = config
+        self.executor = JumpExecutor(binance_manager, logger, config)
+        self.last_prices: MarketPrices = None
+        # How far the best pair of the last scout is from its threshold, relative to the threshold (positive means
+        # over it)
+        self.scout_margin = None
+        self._previous_scout_margin = None
+        # Jump score of each pair by id, with the price versions and threshold it was computed from
+        self._scores: Dict[int, Tuple[Tuple[int, int, float], float]] = {}
+        # (symbol, balance, time fetched) of the current coin, for rescoring candidates
+        self._balance: Optional[Tuple[str, float, float]] = None
+        # Threshold each pair was last ruled out by the order book at, by pair id, to only log it again once the pair
+        # is measured against another threshold. Ticker prices move on nearly every scout, so they can't tell.
+        self._depth_rejected: Dict[int, float] = {}
+
+    def forget_scores(self):
+        """
+        Score every pair again on the next scout, e.g. after the fee or multiplier changed
+        """
+        self._scores.clear()
 
-    def transaction_through_bridge(self, pair: Pair, all_tickers):
+    def transaction_through_bridge(self, pair: Union[Pair, PairInfo], prices: MarketPrices):
         """
         Jump from the source coin to the destination coin through bridge coin
         """
-        if self.manager.sell_alt(pair.from_coin, self.config.BRIDGE) is None:
-            self.logger.info("Couldn't sell, going back to scouting mode...")
+        from_coin = self.db.get_coin(pair.from_coin_id)
+        to_coin = self.db.get_coin(pair.to_coin_id)
+        # Whether it succeeds or not, the jump changes the balances
+        self._balance = None
+        result = self.executor.jump(from_coin, to_coin, prices)
+        if result is None:
+            if self.executor.unfinished_buy is None:
+                self.logger.info("Couldn't sell, going back to scouting mode...")
             return None
-        # This isn't pretty, but at the moment we don't have implemented logic to escape from a bridge coin...
-        # This'll do for now
-        result = None
-        while result is None:
-            result = self.manager.buy_alt(pair.to_coin, self.config.BRIDGE, all_tickers)
 
-        self.db.set_current_coin(pair.to_coin)
-        self.update_trade_threshold(float(result["price"]), all_tickers)
+        self.db.set_current_coin(to_coin)
+        self.update_trade_threshold(to_coin, float(result["price"]), prices)
+
+    def finish_jump(self, prices: MarketPrices):
+        """
+        Buy the coin of the last jump if its buy failed, we only hold the bridge until then
+        """
+        to_coin = self.executor.unfinished_buy
+        self._balance = None
+        result = self.executor.finish_buy(prices)
+        if result is not None:
+            self.db.set_current_coin(to_coin)
+            self.update_trade_threshold(to_coin, float(result["price"]), prices)
+
+    def get_coin_prices(self, prices: MarketPrices) -> Dict[str, float]:
+        """
+        Get the bridge price of every supported coin
+        """
+        coin_prices = {}
+        for symbol in self.config.SUPPORTED_COIN_LIST:
+            price = prices.get(symbol + self.config.BRIDGE_SYMBOL)
+            if price is not None:
+                coin_prices[symbol] = price
+        return coin_prices
+
+    def get_historical_coin_prices(self, symbols: Iterable[str], minutes: int) -> Dict[str, float]:
+        """
+        Get the geometric mean of the bridge price of the given coins over the last minutes. The ratio of two such
+        means is the geometric mean of the ratio of the coins over the same minutes, so they can stand in for
+        current prices when initializing thresholds.
+        """
 
-    def update_trade_threshold(self, current_coin_price: float, all_tickers):
+        def fetch(symbol: str):
+            try:
+                return symbol, self.manager.get_klines(symbol + self.config.BRIDGE_SYMBOL, minutes)
+            except Exception as e:  # pylint: disable=broad-except
+                self.logger.info(
+                    f"Unable to fetch the price history of {symbol + self.config.BRIDGE_SYMBOL}: {e}", False
+                )
+                return symbol, None
+
+        with ThreadPoolExecutor(max_workers=self.HISTORY_WORKERS, thread_name_prefix="history") as pool:
+            candles = {symbol: klines for symbol, klines in pool.map(fetch, symbols) if klines}
+        if not candles:
+            return {}
+
+        # Only use the minutes every coin has a candle for, so that all the means are over the same period
+        minutes_traded = set.intersection(*({kline[0] for kline in klines} for klines in candles.values()))
+        if not minutes_traded:
+            return {}
+        return {
+            symbol: math.exp(
+                sum(math.log(float(kline[4])) for kline in klines if kline[0] in minutes_traded) / len(minutes_traded)
+            )
+            for symbol, klines in candles.items()
+        }
+
+    def update_trade_threshold(self, coin: Coin, coin_price: float, prices: MarketPrices):
         """
         Update all the coins with the threshold of buying the current held coin
         """
-        current_coin = self.db.get_current_coin()
+        if coin_price is None:
+            self.logger.info("Skipping update... current coin {} not found".format(coin + self.config.BRIDGE))
+            return
 
-        if current_coin_price is None:
-            self.logger.info("Skipping update... current coin {} not found".format(current_coin + self.config.BRIDGE))
+        coin_prices = self.get_coin_prices(prices)
+        for symbol in set(self.config.SUPPORTED_COIN_LIST) - set(coin_prices):
+            self.logger.info("Skipping update for coin {} not found".format(symbol + self.config.BRIDGE))
+        if not coin_prices:
             return
 
         session: Session
         with self.db.db_session() as session:
-            for pair in session.query(Pair).filter(Pair.to_coin == current_coin):
-                from_coin_price = get_market_ticker_price_from_list(all_tickers, pair.from_coin + self.config.BRIDGE)
-
-                if from_coin_price is None:
-                    self.logger.info(
-                        "Skipping update for coin {} not found".format(pair.from_coin + self.config.BRIDGE)
-                    )
-                    continue
+            session.query(Pair).filter(Pair.to_coin_id == coin.symbol, Pair.from_coin_id.in_(coin_prices)).update(
+                {Pair.ratio: case(coin_prices, value=Pair.from_coin_id) / coin_price}, synchronize_session=False
+            )
+        self.db.invalidate_pair_graph()
 
-                pair.ratio = from_coin_price / current_coin_price
-
-    def initialize_trade_thresholds(self):
+    def initialize_trade_thresholds(self, prices: MarketPrices = None):
         """
         Initialize the buying threshold of all the coins for trading between them
         """
-        all_tickers = self.manager.get_all_market_tickers()
+        if prices is None:
+            prices = self.manager.get_market_prices()
 
-        session: Session
-        with self.db.db_session() as session:
-            for pair in session.query(Pair).filter(Pair.ratio.is_(None)).all():
-                if not pair.from_coin.enabled or not pair.to_coin.enabled:
-                    continue
-                self.logger.info(f"Initializing {pair.from_coin} vs {pair.to_coin}", False)
+        coin_prices = self.get_coin_prices(prices)
+        for symbol in set(self.config.SUPPORTED_COIN_LIST) - set(coin_prices):
+            self.logger.info("Skipping initializing {}, symbol not found".format(symbol + self.config.BRIDGE))
+        if not coin_prices:
+            return
 
-                from_coin_price = get_market_ticker_price_from_list(all_tickers, pair.from_coin + self.config.BRIDGE)
-                if from_coin_price is None:
-                    self.logger.info(
-                        "Skipping initializing {}, symbol not found".format(pair.from_coin + self.config.BRIDGE)
+        session: Session
+        if self.config.THRESHOLD_SEED_MINUTES > 0:
+            # Every coin of a pair to initialize gets its price from the history, so their ratios are consistent
+            with self.db.db_session() as session:
+                pending = {
+                    symbol
+                    for pair in session.query(Pair.from_coin_id, Pair.to_coin_id).filter(Pair.ratio.is_(None))
+                    for symbol in pair
+                }
+            seeded = pending & coin_prices.keys()
+            if seeded:
+                history = self.get_historical_coin_prices(seeded, self.config.THRESHOLD_SEED_MINUTES)
+                # Mixing historical and current prices would skew the ratios between them, so it's all or nothing
+                if history.keys() == seeded:
+                    coin_prices.update(history)
+                else:
+                    self.logger.warning(
+                        f"Missing the price history of {', '.join(sorted(seeded - history.keys()))}, initializing "
+                        "the new pairs from the current prices"
                     )
-                    continue
 
-                to_coin_price = get_market_ticker_price_from_list(all_tickers, pair.to_coin + self.config.BRIDGE)
-                if to_coin_price is None:
-                    self.logger.info(
-                        "Skipping initializing {}, symbol not found".format(pair.to_coin + self.config.BRIDGE)
-                    )
-                    continue
-
-                pair.ratio = from_coin_price / to_coin_price
+        with self.db.db_session() as session:
+            initialized = (
+                session.query(Pair)
+                .filter(Pair.ratio.is_(None), Pair.from_coin_id.in_(coin_prices), Pair.to_coin_id.in_(coin_prices))
+                .update(
+                    {Pair.ratio: case(coin_prices, value=Pair.from_coin_id) / case(coin_prices, value=Pair.to_coin_id)},
+                    synchronize_session=False,
+                )
+            )
+        self.db.invalidate_pair_graph()
+        if initialized:
+            self.logger.info(f"Initialized {initialized} pairs", False)
 
     def initialize_current_coin(self):
         """
@@ -107,15 +211,20 @@ class AutoTrader:
             if self.config.CURRENT_COIN_SYMBOL == "":
                 current_coin = self.db.get_current_coin()
                 self.logger.info(f"Purchasing {current_coin} to begin trading")
-                all_tickers = self.manager.get_all_market_tickers()
-                self.manager.buy_alt(current_coin, self.config.BRIDGE, all_tickers)
+                prices = self.manager.get_market_prices()
+                self.manager.buy_alt(current_coin, self.config.BRIDGE, prices)
                 self.logger.info("Ready to start trading")
 
     def scout(self):
         """
         Scout for potential jumps from the current coin to another coin
         """
-        all_tickers = self.manager.get_all_market_tickers()
+        prices = self.manager.get_market_prices()
+        self.last_prices = prices
+
+        if self.executor.unfinished_buy is not None:
+            self.finish_jump(prices)
+            return
 
         current_coin = self.db.get_current_coin()
         # Display on the console, the current coin+Bridge, so users can see *some* activity and not think the bot has
@@ -128,18 +237,20 @@ class AutoTrader:
             end="\r",
         )
 
-        current_coin_price = get_market_ticker_price_from_list(all_tickers, current_coin + self.config.BRIDGE)
+        current_coin_price = prices.get(current_coin + self.config.BRIDGE)
 
         if current_coin_price is None:
             self.logger.info("Skipping scouting... current coin {} not found".format(current_coin + self.config.BRIDGE))
             return
 
-        ratio_dict: Dict[Pair, float] = {}
+        ratio_dict: Dict[PairInfo, float] = {}
+        scouted = []
+        current_coin_version = prices.version(current_coin + self.config.BRIDGE)
 
-        for pair in self.db.get_pairs_from(current_coin):
+        for pair in self.db.get_market_pairs_from(current_coin):
             if not pair.to_coin.enabled:
                 continue
-            optional_coin_price = get_market_ticker_price_from_list(all_tickers, pair.to_coin + self.config.BRIDGE)
+            optional_coin_price = prices.get(pair.to_coin + self.config.BRIDGE)
 
             if optional_coin_price is None:
                 self.logger.info(
@@ -147,43 +258,145 @@ class AutoTrader:
                 )
                 continue
 
-            self.db.log_scout(pair, pair.ratio, current_coin_price, optional_coin_price)
+            # Neither price nor the threshold moved since the last scout, neither did the score
+            key = (current_coin_version, prices.version(pair.to_coin + self.config.BRIDGE), pair.ratio)
+            cached = self._scores.get(pair.id)
+            if cached is not None and cached[0] == key:
+                ratio_dict[pair] = cached[1]
+                continue
+
+            scouted.append((pair, pair.ratio, current_coin_price, optional_coin_price))
 
             # Obtain (current coin)/(optional coin)
             coin_opt_coin_ratio = current_coin_price / optional_coin_price
 
             # save ratio so we can pick the best option, not necessarily the first
-            ratio_dict[pair] = (
-                coin_opt_coin_ratio
-                - self.config.SCOUT_TRANSACTION_FEE * self.config.SCOUT_MULTIPLIER * coin_opt_coin_ratio
-            ) - pair.ratio
+            ratio_dict[pair] = self._jump_score(pair, coin_opt_coin_ratio)
+            self._scores[pair.id] = (key, ratio_dict[pair])
+
+        if scouted:
+            self.db.log_scouts(scouted)
+
+        self._previous_scout_margin = self.scout_margin
+        self.scout_margin = max((score / pair.ratio for pair, score in ratio_dict.items()), default=None)
 
         # keep only ratios bigger than zero
         ratio_dict = {k: v for k, v in ratio_dict.items() if v > 0}
 
+        # The ticker is only the last traded price, so re-score the viable options with the prices the order book
+        # would actually give us for our balance
+        ratio_dict = self._rescore_with_order_book(current_coin, ratio_dict)
+
         # if we have any viable options, pick the one with the biggest ratio
         if ratio_dict:
             best_pair = max(ratio_dict, key=ratio_dict.get)
             self.logger.info(f"Will be jumping from {current_coin} to {best_pair.to_coin_id}")
-            self.transaction_through_bridge(best_pair, all_tickers)
+            self.transaction_through_bridge(best_pair, prices)
+
+    def get_scout_interval(self, interval: float):
+        """
+        Pick the next scouting interval from the current one: as short as allowed when the best pair is near its
+        threshold, as long as allowed when it is far from it, and backing off while the market doesn't move
+        """
+        if self.scout_margin is None:
+            return self.config.SCOUT_MAX_SLEEP_TIME
+
+        min_interval = self.config.SCOUT_MIN_SLEEP_TIME
+        max_interval = self.config.SCOUT_MAX_SLEEP_TIME
+
+        distance = min(max(-self.scout_margin, self.NEAR_THRESHOLD), self.FAR_FROM_THRESHOLD)
+        position = (distance - self.NEAR_THRESHOLD) / (self.FAR_FROM_THRESHOLD - self.NEAR_THRESHOLD)
+        next_interval = min_interval + position * (max_interval - min_interval)
+
+        if self._previous_scout_margin is not None and abs(self.scout_margin - self._previous_scout_margin) < 1e-6:
+            next_interval = max(next_interval, min(interval * 2, max_interval))
+        return next_interval
+
+    def _jump_score(self, pair: PairInfo, coin_opt_coin_ratio: float):
+        return (
+            coin_opt_coin_ratio - self.config.SCOUT_TRANSACTION_FEE * self.config.SCOUT_MULTIPLIER * coin_opt_coin_ratio
+        ) - pair.ratio
+
+    def _rescore_with_order_book(self, current_coin: Coin, ratio_dict: Dict[PairInfo, float]):
+        """
+        Recompute the jump score of the candidate pairs from the volume weighted fill prices of selling our whole
+        balance of the current coin and buying the candidate with the proceeds
+        """
+        if not ratio_dict:
+            return ratio_dict
+
+        balance = self._get_balance(current_coin.symbol)
+        sell_price = self.manager.get_fill_price(current_coin + self.config.BRIDGE, False, quantity=balance)
+        if sell_price is None:
+            return ratio_dict
+
+        rescored: Dict[PairInfo, float] = {}
+        for pair, score in ratio_dict.items():
+            buy_price = self.manager.get_fill_price(
+                pair.to_coin + self.config.BRIDGE, True, quote_quantity=(balance or 0) * sell_price
+            )
+            if buy_price is None:
+                rescored[pair] = score
+                continue
+
+            score = self._jump_score(pair, sell_price / buy_price)
+            if score > 0:
+                rescored[pair] = score
+                continue
+            if self._depth_rejected.get(pair.id) != pair.ratio:
+                self._depth_rejected[pair.id] = pair.ratio
+                self.logger.info(f"Not jumping to {pair.to_coin_id}, order book depth would eat the margin", False)
+        return rescored
+
+    def _get_balance(self, symbol: str):
+        cached = self._balance
+        if cached is None or cached[0] != symbol or time.monotonic() - cached[2] > self.BALANCE_MAX_AGE:
+            cached = self._balance = (symbol, self.manager.get_currency_balance(symbol), time.monotonic())
+        return cached[1]
 
     def update_values(self):
         """
         Log current value state of all altcoin balances against BTC and USDT in DB.
         """
-        all_ticker_values = self.manager.get_all_market_tickers()
+        prices = self.manager.get_market_prices()
+        balances = self.manager.get_currency_balances()
 
         now = datetime.now()
 
         session: Session
         with self.db.db_session() as session:
-            coins: List[Coin] = session.query(Coin).all()
-            for coin in coins:
-                balance = self.manager.get_currency_balance(coin.symbol)
+            coins: Dict[str, Coin] = {coin.symbol: coin for coin in session.query(Coin).all()}
+            values: List[CoinValue] = []
+            for symbol, balance in balances.items():
                 if balance == 0:
                     continue
-                usd_value = get_market_ticker_price_from_list(all_ticker_values, coin + "USDT")
-                btc_value = get_market_ticker_price_from_list(all_ticker_values, coin + "BTC")
-                cv = CoinValue(coin, balance, usd_value, btc_value, datetime=now)
-                session.add(cv)
-                self.db.send_update(cv)
+                usd_price = 1.0 if symbol == "USDT" else prices.get(symbol + "USDT")
+                btc_price = 1.0 if symbol == "BTC" else prices.get(symbol + "BTC")
+                if symbol == "USDT" and "BTCUSDT" in prices:
+                    btc_price = 1 / prices.get("BTCUSDT")
+                if usd_price is None and btc_price is None:
+                    continue
+
+                # Held assets outside of the coin list still count towards the value of the account
+                if symbol not in coins:
+                    coins[symbol] = Coin(symbol, False)
+                    session.add(coins[symbol])
+                values.append(CoinValue(coins[symbol], balance, usd_price, btc_price, datetime=now))
+
+            session.flush()
+            session.bulk_insert_mappings(
+                CoinValue,
+                [
+                    {
+                        "coin_id": cv.coin.symbol,
+                        "balance": cv.balance,
+                        "usd_price": cv.usd_price,
+                        "btc_price": cv.btc_price,
+                        "interval": cv.interval,
+                        "datetime": cv.datetime,
+                    }
+                    for cv in values
+                ],
+            )
+            self.db.record_portfolio_value(session, values, now)
+            self.db.send_updates(values)
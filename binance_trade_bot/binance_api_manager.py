@@ -1,5 +1,8 @@
 import math
+import threading
 import time
+import uuid
+from typing import Dict, Optional
 
 from binance.client import Client
 from binance.exceptions import BinanceAPIException
@@ -7,145 +10,454 @@ from binance.exceptions import BinanceAPIException
 from .config import Config
 from .database import Database
 from .logger import Logger
+from .market import MarketPrices, SymbolTable
+from .market_data import MarketDataCache
 from .models import Coin
-from .utils import get_market_ticker_price_from_list
+from .order_book import OrderBookCache, estimate_fill, estimate_fill_price
+from .recording import TickerRecorder
+from .retry import Retrier, is_rate_limited, is_transient
+
+# Statuses of an order that was taken off the book before it filled completely
+UNFILLABLE_ORDER_STATUSES = {"CANCELED", "EXPIRED", "REJECTED"}
+
+
+class OrderFailedError(Exception):
+    pass
 
 
 class BinanceAPIManager:
-    def __init__(self, config: Config, db: Database, logger: Logger):
-        self.binance_client = Client(
+    # How old the order book fetched by `prepare_buy` can be by the time the buy is placed
+    PREPARED_BOOK_MAX_AGE = 1.0
+    # Most candles Binance returns for a single request
+    MAX_KLINES = 1000
+
+    def __init__(
+        self,
+        config: Config,
+        db: Database,
+        logger: Logger,
+        market_data: MarketDataCache = None,
+        binance_client: Client = None,
+    ):
+        # Any object with the methods of the Binance client can be given, e.g. to replay recorded tickers
+        self.binance_client = binance_client or Client(
             config.BINANCE_API_KEY,
             config.BINANCE_API_SECRET_KEY,
             tld=config.BINANCE_TLD,
         )
         self.db = db
         self.logger = logger
+        self.config = config
+        self.market_data = market_data
+        if market_data is not None:
+            self.order_books = market_data.order_books
+            self.symbol_info = market_data.symbol_info
+            self.symbols = market_data.symbols
+        else:
+            self.order_books = OrderBookCache(self.binance_client)
+            self.symbol_info: Dict[str, dict] = {}
+            self.symbols = SymbolTable()
+        # Shared market data is fetched on behalf of several bots, which would each record the same snapshots
+        self.recorder = TickerRecorder() if config.RECORD_TICKERS and market_data is None else None
+        # Orders placed but not yet filled, keyed by trade id, so they can be resumed after a restart
+        self.pending_orders: Dict[int, dict] = {}
+        self.retrier = Retrier(logger)
+        # Last snapshot fetched without shared market data, which the versions of the next one carry on from
+        self._last_prices: Optional[MarketPrices] = None
+        self._prices_lock = threading.Lock()
+
+    def _call(self, endpoint: str, *args, **kwargs):
+        """
+        Call a method of the Binance client with the retry policy of that endpoint
+        """
+        return self.retrier.call(endpoint, getattr(self.binance_client, endpoint), *args, **kwargs)
 
     def get_all_market_tickers(self):
         """
         Get ticker price of all coins
         """
-        return self.binance_client.get_all_tickers()
+        if self.market_data is not None:
+            all_tickers = self.market_data.get_all_tickers()
+        else:
+            all_tickers = self._call("get_all_tickers")
+        if self.recorder is not None:
+            self.recorder.record(all_tickers)
+        return all_tickers
+
+    def get_market_prices(self) -> MarketPrices:
+        """
+        Get ticker price of all coins, parsed into a MarketPrices snapshot
+        """
+        if self.market_data is not None:
+            return self.market_data.get_prices()
+        all_tickers = self.get_all_market_tickers()
+        # Snapshots built side by side from the same previous one would give different prices the same version
+        with self._prices_lock:
+            self._last_prices = MarketPrices.from_tickers(all_tickers, self.symbols, previous=self._last_prices)
+            return self._last_prices
 
     def get_market_ticker_price(self, ticker_symbol: str):
         """
         Get ticker price of a specific coin
         """
-        for ticker in self.binance_client.get_symbol_ticker():
+        for ticker in self._call("get_symbol_ticker"):
             if ticker["symbol"] == ticker_symbol:
                 return float(ticker["price"])
         return None
 
+    def get_klines(self, ticker_symbol: str, minutes: int):
+        """
+        Get the 1 minute candles of the last `minutes` minutes, up to MAX_KLINES of them, oldest first
+        """
+        limit = min(minutes, self.MAX_KLINES)
+        return self._call("get_klines", symbol=ticker_symbol, interval=Client.KLINE_INTERVAL_1MINUTE, limit=limit)
+
+    def get_fill_price(self, ticker_symbol: str, buying: bool, quantity: float = None, quote_quantity: float = None):
+        """
+        Estimate the volume weighted price of an order of the given size from the order book
+        """
+        try:
+            book = self.order_books.get(ticker_symbol)
+        except Exception as e:  # pylint: disable=broad-except
+            self.logger.info(f"Unable to fetch order book for {ticker_symbol}: {e}", False)
+            return None
+        return estimate_fill_price(book, buying, quantity=quantity, quote_quantity=quote_quantity)
+
+    def get_limit_buy_price(
+        self, ticker_symbol: str, quantity: float = None, quote_quantity: float = None, max_age: float = 0
+    ):
+        """
+        Get the price of the deepest ask level needed to fill the order, so that a limit order at that price fills
+        right away instead of resting at the last traded price
+        """
+        try:
+            book = self.order_books.get(ticker_symbol, max_age=max_age)
+        except Exception as e:  # pylint: disable=broad-except
+            self.logger.info(f"Unable to fetch order book for {ticker_symbol}: {e}", False)
+            return None
+        fill = estimate_fill(book.asks, quantity=quantity, quote_quantity=quote_quantity)
+        return fill[1] if fill else None
+
     def get_currency_balance(self, currency_symbol: str):
         """
         Get balance of a specific coin
         """
-        for currency_balance in self.binance_client.get_account()["balances"]:
-            if currency_balance["asset"] == currency_symbol:
-                return float(currency_balance["free"])
-        return None
+        return self.get_currency_balances().get(currency_symbol)
+
+    def get_currency_balances(self) -> Dict[str, float]:
+        """
+        Get the free balance of every asset of the account, from a single account snapshot
+        """
+        return {
+            currency_balance["asset"]: float(currency_balance["free"])
+            for currency_balance in self._call("get_account")["balances"]
+        }
 
     def retry(self, func, *args, **kwargs):
-        time.sleep(1)
-        attempts = 0
-        while attempts < 20:
+        """
+        Run a buy or sell with the retry policy of its name, waiting out an open circuit breaker rather than leaving
+        the trade half done. Returns None if it keeps failing.
+        """
+        with self.retrier.critical():
             try:
-                return func(*args, **kwargs)
+                return self.retrier.call(func.__name__.lstrip("_"), func, *args, **kwargs)
             except Exception as e:  # pylint: disable=broad-except
-                self.logger.info("Failed to Buy/Sell. Trying Again.")
-                if attempts == 0:
-                    self.logger.info(e)
-                attempts += 1
-        return None
+                self.logger.info(f"Failed to Buy/Sell, giving up: {e}")
+                return None
+
+    def get_symbol_info(self, symbol: str):
+        """
+        Get the exchange info of a symbol, which only changes on exchange-side listing updates
+        """
+        if symbol not in self.symbol_info:
+            self.symbol_info[symbol] = self._call("get_symbol_info", symbol)
+        return self.symbol_info[symbol]
 
     def get_alt_tick(self, origin_symbol: str, target_symbol: str):
         step_size = next(
             _filter["stepSize"]
-            for _filter in self.binance_client.get_symbol_info(origin_symbol + target_symbol)["filters"]
+            for _filter in self.get_symbol_info(origin_symbol + target_symbol)["filters"]
             if _filter["filterType"] == "LOT_SIZE"
         )
         if step_size.find("1") == 0:
             return 1 - step_size.find(".")
         return step_size.find("1") - 1
 
-    def wait_for_order(self, origin_symbol, target_symbol, order_id):
+    def wait_for_order(self, origin_symbol, target_symbol, order_id, timeout=None):
+        """
+        Wait until the order is filled, or won't fill any further. Returns None if it is still open after `timeout`
+        seconds.
+        """
+        start = time.time()
+        order_status = self.get_order(origin_symbol, target_symbol, order_id)
+        self.logger.info(order_status)
+
+        while order_status["status"] != "FILLED" and order_status["status"] not in UNFILLABLE_ORDER_STATUSES:
+            if timeout is not None and time.time() - start > timeout:
+                return None
+            order_status = self.get_order(origin_symbol, target_symbol, order_id)
+
+        return order_status
+
+    def get_order(self, origin_symbol, target_symbol, order_id):
+        """
+        Get the status of an order we placed. The order is already out there, so this doesn't give up.
+        """
         while True:
             try:
-                order_status = self.binance_client.get_order(symbol=origin_symbol + target_symbol, orderId=order_id)
-                break
-            except BinanceAPIException as e:
-                self.logger.info(e)
-                time.sleep(1)
+                return self._call("get_order", symbol=origin_symbol + target_symbol, orderId=order_id)
             except Exception as e:  # pylint: disable=broad-except
-                self.logger.info(f"Unexpected Error: {e}")
+                self.logger.info(f"Unable to get the status of order {order_id}: {e}")
                 time.sleep(1)
 
-        self.logger.info(order_status)
-
-        while order_status["status"] != "FILLED":
+    def cancel_order(self, origin_symbol, target_symbol, order_id):
+        """
+        Cancel an open order and return its final status
+        """
+        try:
+            self._call("cancel_order", symbol=origin_symbol + target_symbol, orderId=order_id)
+        except BinanceAPIException as e:
+            # The order may have been filled in the meantime
+            self.logger.info(e)
+        return self.get_order(origin_symbol, target_symbol, order_id)
+
+    def settle_order(self, origin_symbol, target_symbol, order):
+        """
+        Make sure an order we placed is off the book, cancelling it if it is still open, and return its final status.
+        The order is looked up by our own id, whatever we know of it. It is out there, so this doesn't give up.
+        """
+        symbol = origin_symbol + target_symbol
+        while True:
             try:
-                order_status = self.binance_client.get_order(symbol=origin_symbol + target_symbol, orderId=order_id)
-            except BinanceAPIException as e:
-                self.logger.info(e)
-                time.sleep(1)
+                stat = self._call("get_order", symbol=symbol, origClientOrderId=order["clientOrderId"])
+                if stat["status"] == "FILLED" or stat["status"] in UNFILLABLE_ORDER_STATUSES:
+                    return stat
+                self._call("cancel_order", symbol=symbol, orderId=stat["orderId"])
             except Exception as e:  # pylint: disable=broad-except
-                self.logger.info(f"Unexpected Error: {e}")
+                self.logger.info(f"Unable to settle order {order['orderId']}: {e}")
                 time.sleep(1)
 
-        return order_status
-
-    def buy_alt(self, origin_coin: Coin, target_coin: Coin, all_tickers):
-        return self.retry(self._buy_alt, origin_coin, target_coin, all_tickers)
-
-    def _buy_alt(self, origin_coin: Coin, target_coin: Coin, all_tickers):
+    def _track_order(
+        self, trade_log, origin_symbol: str, target_symbol: str, order, quote_amount=0.0, jump_to: str = None
+    ):  # pylint: disable=too-many-arguments
+        self.pending_orders[trade_log.trade_id] = {
+            "trade_id": trade_log.trade_id,
+            "origin_symbol": origin_symbol,
+            "target_symbol": target_symbol,
+            "order_id": order["orderId"],
+            "selling": trade_log.selling,
+            # Quote amount already filled by previous, cancelled orders of the same trade
+            "quote_amount": quote_amount,
+            # Coin the proceeds of a sell are for, when it is the first half of a jump
+            "jump_to": jump_to,
+        }
+
+    def reconcile_pending_orders(self, pending_orders: Dict[int, dict]):
+        """
+        Resume trades whose orders were still open when the bot stopped. Orders that are still open after the buy
+        timeout are cancelled, and trades whose order ended without filling completely are marked as failed. Returns
+        the status of the buy order if one completed, and the symbol of the coin a jump still has to buy, if its sell
+        went through but its buy didn't.
+        """
+        bought = None
+        unfinished_buy = None
+        for _, pending in sorted(pending_orders.items()):
+            trade_log = self.db.resume_trade_log(pending["trade_id"])
+            if trade_log is None:
+                continue
+            origin_symbol = pending["origin_symbol"]
+            target_symbol = pending["target_symbol"]
+            self.logger.info(f"Resuming order {pending['order_id']} for {origin_symbol}{target_symbol}")
+
+            self.pending_orders[pending["trade_id"]] = pending
+            with self.retrier.critical():
+                stat = self.wait_for_order(origin_symbol, target_symbol, pending["order_id"], self.config.BUY_TIMEOUT)
+                if stat is None:
+                    self.logger.info(f"Order {pending['order_id']} still open after {self.config.BUY_TIMEOUT}s")
+                    stat = self.cancel_order(origin_symbol, target_symbol, pending["order_id"])
+            self.pending_orders.pop(pending["trade_id"], None)
+
+            quote_amount = pending["quote_amount"] + float(stat["cummulativeQuoteQty"])
+            if stat["status"] != "FILLED":
+                self.logger.warning(
+                    f"Order {pending['order_id']} for {origin_symbol}{target_symbol} is {stat['status']} with "
+                    f"{stat['executedQty']} filled, marking trade {pending['trade_id']} as failed"
+                )
+                trade_log.set_failed(float(stat["executedQty"]), quote_amount)
+                if not pending["selling"]:
+                    unfinished_buy = origin_symbol
+                continue
+            trade_log.set_complete(quote_amount)
+
+            if pending["selling"]:
+                # Snapshots of older versions didn't know what the sell was for
+                unfinished_buy = pending.get("jump_to")
+            else:
+                bought = stat
+                unfinished_buy = None
+        return bought, unfinished_buy
+
+    def prepare_buy(self, origin_coin: Coin, target_coin: Coin):
+        """
+        Fetch everything a buy needs that doesn't depend on the balance it is paid with, so that it can be done while
+        the sell funding it is still in flight
         """
-        Buy altcoin
+        origin_symbol = origin_coin.symbol
+        target_symbol = target_coin.symbol
+        prepared = {
+            "tick": self.get_alt_tick(origin_symbol, target_symbol),
+            "origin_balance": self.get_currency_balance(origin_symbol),
+        }
+        try:
+            self.order_books.get(origin_symbol + target_symbol, max_age=0)
+        except Exception as e:  # pylint: disable=broad-except
+            self.logger.info(f"Unable to fetch order book for {origin_symbol + target_symbol}: {e}", False)
+        return prepared
+
+    def buy_alt(
+        self,
+        origin_coin: Coin,
+        target_coin: Coin,
+        prices: MarketPrices,
+        prepared: dict = None,
+        target_balance: float = None,
+    ):
+        if prepared is not None or target_balance is not None:
+            try:
+                with self.retrier.critical():
+                    return self._buy_alt(origin_coin, target_coin, prices, prepared, target_balance)
+            except Exception as e:  # pylint: disable=broad-except
+                self.logger.info(f"Prepared buy failed, buying with fresh balances: {e}")
+        return self.retry(self._buy_alt, origin_coin, target_coin, prices)
+
+    def _buy_alt(
+        self,
+        origin_coin: Coin,
+        target_coin: Coin,
+        prices: MarketPrices,
+        prepared: dict = None,
+        target_balance: float = None,
+    ):
+        """
+        Buy altcoin, with the result of `prepare_buy` and the balance of the target coin if they are already known
         """
         trade_log = self.db.start_trade_log(origin_coin, target_coin, False)
         origin_symbol = origin_coin.symbol
         target_symbol = target_coin.symbol
 
-        origin_tick = self.get_alt_tick(origin_symbol, target_symbol)
-
-        origin_balance = self.get_currency_balance(origin_symbol)
-        target_balance = self.get_currency_balance(target_symbol)
-        from_coin_price = get_market_ticker_price_from_list(all_tickers, origin_symbol + target_symbol)
+        book_max_age = self.PREPARED_BOOK_MAX_AGE
+        if prepared is None:
+            prepared = self.prepare_buy(origin_coin, target_coin)
+            book_max_age = 0
+        origin_tick = prepared["tick"]
+        origin_balance = prepared["origin_balance"]
+        if target_balance is None:
+            target_balance = self.get_currency_balance(target_symbol)
+
+        from_coin_price = self.get_limit_buy_price(
+            origin_symbol + target_symbol, quote_quantity=target_balance, max_age=book_max_age
+        )
+        if from_coin_price is None:
+            from_coin_price = prices.get(origin_symbol + target_symbol)
 
         order_quantity = math.floor(target_balance * 10 ** origin_tick / from_coin_price) / float(10 ** origin_tick)
         self.logger.info(f"BUY QTY {order_quantity}")
 
-        # Try to buy until successful
-        order = None
-        while order is None:
-            try:
-                order = self.binance_client.order_limit_buy(
-                    symbol=origin_symbol + target_symbol,
-                    quantity=order_quantity,
-                    price=from_coin_price,
+        order = self._place_limit_buy(origin_symbol, target_symbol, order_quantity, from_coin_price)
+
+        quote_amount = 0.0
+        remaining_quantity = order_quantity
+        # Order whose fills aren't counted in quote_amount yet, which may still be on the book
+        live_order = order
+        try:
+            trade_log.set_ordered(origin_balance, target_balance, order_quantity)
+            self._track_order(trade_log, origin_symbol, target_symbol, order)
+
+            # If the book moved away from our price, cancel and re-quote the remainder instead of waiting forever
+            stat = self.wait_for_order(origin_symbol, target_symbol, order["orderId"], self.config.BUY_TIMEOUT)
+            while stat is None or stat["status"] != "FILLED":
+                # An order that expired or was cancelled on the exchange side is re-quoted like one we cancelled
+                if stat is None:
+                    stat = self.cancel_order(origin_symbol, target_symbol, order["orderId"])
+                quote_amount += float(stat["cummulativeQuoteQty"])
+                live_order = None
+                if stat["status"] == "FILLED":
+                    break
+                remaining_quantity = math.floor(
+                    (remaining_quantity - float(stat["executedQty"])) * 10 ** origin_tick
+                ) / float(10 ** origin_tick)
+                if remaining_quantity <= 0:
+                    break
+                from_coin_price = self.get_limit_buy_price(origin_symbol + target_symbol, quantity=remaining_quantity)
+                if from_coin_price is None:
+                    from_coin_price = float(order["price"])
+                self.logger.info(
+                    f"Order not filled in {self.config.BUY_TIMEOUT}s, re-quoting {remaining_quantity} at "
+                    f"{from_coin_price}"
                 )
-                self.logger.info(order)
-            except BinanceAPIException as e:
-                self.logger.info(e)
-                time.sleep(1)
-            except Exception as e:  # pylint: disable=broad-except
-                self.logger.info(f"Unexpected Error: {e}")
-
-        trade_log.set_ordered(origin_balance, target_balance, order_quantity)
-
-        stat = self.wait_for_order(origin_symbol, target_symbol, order["orderId"])
-
-        self.logger.info(f"Bought {origin_symbol}")
-
-        trade_log.set_complete(stat["cummulativeQuoteQty"])
+                order = live_order = self._place_limit_buy(
+                    origin_symbol, target_symbol, remaining_quantity, from_coin_price
+                )
+                self._track_order(trade_log, origin_symbol, target_symbol, order, quote_amount)
+                stat = self.wait_for_order(origin_symbol, target_symbol, order["orderId"], self.config.BUY_TIMEOUT)
+            else:
+                # The last order filled while we waited for it, the cancelled ones are already counted
+                quote_amount += float(stat["cummulativeQuoteQty"])
+        except Exception as e:  # pylint: disable=broad-except
+            # A retry starts over with a new order, so make sure this one is off the book first rather than buying
+            # twice. The entry is only dropped from the pending orders here and once the buy is done: when the bot
+            # stops instead, the state snapshot needs it to resume the order.
+            stat = None
+            if live_order is not None:
+                self.logger.info(f"Buy of {origin_symbol} interrupted ({e}), settling order {live_order['orderId']}")
+                stat = self.settle_order(origin_symbol, target_symbol, live_order)
+                quote_amount += float(stat["cummulativeQuoteQty"])
+            if stat is None or stat["status"] != "FILLED":
+                self.pending_orders.pop(trade_log.trade_id, None)
+                filled = order_quantity - remaining_quantity + (float(stat["executedQty"]) if stat else 0.0)
+                trade_log.set_failed(filled, quote_amount)
+                raise
+
+        self.logger.info(f"Bought {origin_symbol}", urgent=True)
+
+        trade_log.set_complete(quote_amount)
+        self.pending_orders.pop(trade_log.trade_id, None)
 
         return order
 
-    def sell_alt(self, origin_coin: Coin, target_coin: Coin):
-        return self.retry(self._sell_alt, origin_coin, target_coin)
+    def _place_limit_buy(self, origin_symbol: str, target_symbol: str, quantity: float, price: float):
+        order = self._place_order("order_limit_buy", origin_symbol + target_symbol, quantity=quantity, price=price)
+        self.logger.info(order)
+        return order
 
-    def _sell_alt(self, origin_coin: Coin, target_coin: Coin):
+    def _place_order(self, endpoint: str, symbol: str, **params):
+        """
+        Place an order with an id of our own. When the request fails without telling whether the order was placed,
+        e.g. on a timeout or -1007, look the order up by that id, and only let the error through if it isn't there.
         """
-        Sell altcoin
+        client_order_id = f"btb-{uuid.uuid4().hex}"
+        try:
+            return self._call(endpoint, symbol=symbol, newClientOrderId=client_order_id, **params)
+        except Exception as e:  # pylint: disable=broad-except
+            # A rate limited request is rejected before it is executed
+            if not is_transient(e) or is_rate_limited(e):
+                raise
+            self.logger.info(f"Placing order {client_order_id} failed ({e}), checking whether Binance got it")
+            try:
+                order = self._call("get_order", symbol=symbol, origClientOrderId=client_order_id)
+            except BinanceAPIException as lookup_error:
+                if lookup_error.code == -2013:
+                    raise e from None
+                raise
+            self.logger.info(f"Order {client_order_id} was placed anyway")
+            return order
+
+    def sell_alt(self, origin_coin: Coin, target_coin: Coin, jump_to: Coin = None):
+        return self.retry(self._sell_alt, origin_coin, target_coin, jump_to)
+
+    def _sell_alt(self, origin_coin: Coin, target_coin: Coin, jump_to: Coin = None):
+        """
+        Sell altcoin, to buy `jump_to` with the proceeds if it is given
         """
         trade_log = self.db.start_trade_log(origin_coin, target_coin, True)
         origin_symbol = origin_coin.symbol
@@ -153,36 +465,40 @@ class BinanceAPIManager:
 
         origin_tick = self.get_alt_tick(origin_symbol, target_symbol)
 
-        order_quantity = math.floor(self.get_currency_balance(origin_symbol) * 10 ** origin_tick) / float(
-            10 ** origin_tick
-        )
+        balances = self.get_currency_balances()
+        origin_balance = balances.get(origin_symbol)
+        target_balance = balances.get(target_symbol, 0.0)
+        order_quantity = math.floor(origin_balance * 10 ** origin_tick) / float(10 ** origin_tick)
         self.logger.info(f"Selling {order_quantity} of {origin_symbol}")
-
-        origin_balance = self.get_currency_balance(origin_symbol)
-        target_balance = self.get_currency_balance(target_symbol)
         self.logger.info(f"Balance is {origin_balance}")
-        order = None
-        while order is None:
-            order = self.binance_client.order_market_sell(
-                symbol=origin_symbol + target_symbol, quantity=(order_quantity)
-            )
+        order = self._place_order("order_market_sell", origin_symbol + target_symbol, quantity=order_quantity)
 
         self.logger.info("order")
         self.logger.info(order)
 
         trade_log.set_ordered(origin_balance, target_balance, order_quantity)
+        self._track_order(
+            trade_log, origin_symbol, target_symbol, order, jump_to=jump_to.symbol if jump_to is not None else None
+        )
 
         # Binance server can take some time to save the order
         self.logger.info("Waiting for Binance")
 
         stat = self.wait_for_order(origin_symbol, target_symbol, order["orderId"])
+        if stat["status"] != "FILLED":
+            # e.g. a market order that ran out of liquidity, the retry sells what is left
+            trade_log.set_failed(float(stat["executedQty"]), float(stat["cummulativeQuoteQty"]))
+            self.pending_orders.pop(trade_log.trade_id, None)
+            raise OrderFailedError(f"Sell order {order['orderId']} is {stat['status']}")
 
-        new_balance = self.get_currency_balance(origin_symbol)
-        while new_balance >= origin_balance:
-            new_balance = self.get_currency_balance(origin_symbol)
-
-        self.logger.info(f"Sold {origin_symbol}")
+        self.logger.info(f"Sold {origin_symbol}", urgent=True)
 
         trade_log.set_complete(stat["cummulativeQuoteQty"])
+        self.pending_orders.pop(trade_log.trade_id, None)
 
+        # The account endpoint can lag behind the fill, so rather than polling it until the proceeds show up, give
+        # the balance they are known to bring, assuming the fee is taken from them
+        order["target_balance"] = target_balance + float(stat["cummulativeQuoteQty"]) * (
+            1 - self.config.SCOUT_TRANSACTION_FEE
+        )
         return order
@@ -1,15 +1,44 @@
 # Config consts
 import configparser
 import os
+from typing import Any, Callable, Dict, List, Tuple
 
 from .models import Coin
 
 CFG_FL_NAME = "user.cfg"
 USER_CFG_SECTION = "binance_user_config"
+SUPPORTED_COIN_LIST_FL_NAME = "supported_coin_list"
+
+# Settings that a running bot picks up when the configuration is reloaded, the others need a restart
+RELOADABLE_SETTINGS = {
+    "SUPPORTED_COIN_LIST",
+    "SCOUT_TRANSACTION_FEE",
+    "SCOUT_MULTIPLIER",
+    "SCOUT_SLEEP_TIME",
+    "SCOUT_ADAPTIVE",
+    "SCOUT_MIN_SLEEP_TIME",
+    "SCOUT_MAX_SLEEP_TIME",
+    "BUY_TIMEOUT",
+    "THRESHOLD_SEED_MINUTES",
+    "SCOUT_HISTORY_PRUNE_TIME",
+    "ARCHIVE_SCOUT_HISTORY",
+    "ARCHIVE_VALUE_HISTORY",
+    "PROFILE_SECONDS",
+}
+
+# Number of reloads asked for with `request_reload`, e.g. on SIGHUP, which every ConfigWatcher compares to its own
+_reload_requests = 0
 
 
 class Config:  # pylint: disable=too-few-public-methods
-    def __init__(self):
+    def __init__(self, config_file=CFG_FL_NAME, use_environment=True, defaults: Dict[str, str] = None):
+        # Environment variables are shared by the whole process, so profiles loaded by the multi-account runner
+        # only read their own file
+        env = os.environ if use_environment else {}
+        self.config_file = config_file
+        self.use_environment = use_environment
+        self.defaults = defaults
+
         # Init config
         config = configparser.ConfigParser()
         config["DEFAULT"] = {
@@ -17,47 +46,130 @@ class Config:  # pylint: disable=too-few-public-methods
             "scout_transaction_fee": "0.001",
             "scout_multiplier": "5",
             "scout_sleep_time": "5",
+            "scout_adaptive": "false",
+            "scout_min_sleep_time": "0.5",
+            "scout_max_sleep_time": "10",
+            "buy_timeout": "30",
+            "threshold_seed_minutes": "0",
             "hourToKeepScoutHistory": "1",
+            "archive_scout_history": "false",
+            "archive_value_history": "false",
             "tld": "com",
+            "database": "data/crypto_trading.db",
+            "read_replica": "false",
+            "read_replica_interval": "30",
+            "record_tickers": "false",
+            "supported_coin_list": "",
+            "log_json": "false",
+            "log_max_bytes": str(10 * 1024 * 1024),
+            "log_backup_count": "5",
+            "profile_seconds": "30",
+            # e.g. settings that are required to trade but not to simulate
+            **(defaults or {}),
         }
 
-        if not os.path.exists(CFG_FL_NAME):
-            print("No configuration file (user.cfg) found! See README. Assuming default config...")
+        if not os.path.exists(config_file):
+            print(f"No configuration file ({config_file}) found! See README. Assuming default config...")
             config[USER_CFG_SECTION] = {}
         else:
-            config.read(CFG_FL_NAME)
+            config.read(config_file)
 
-        self.BRIDGE_SYMBOL = os.environ.get("BRIDGE_SYMBOL") or config.get(USER_CFG_SECTION, "bridge")
+        self.BRIDGE_SYMBOL = env.get("BRIDGE_SYMBOL") or config.get(USER_CFG_SECTION, "bridge")
         self.BRIDGE = Coin(self.BRIDGE_SYMBOL, False)
 
         # Prune settings
         self.SCOUT_HISTORY_PRUNE_TIME = float(
-            os.environ.get("HOURS_TO_KEEP_SCOUTING_HISTORY") or config.get(USER_CFG_SECTION, "hourToKeepScoutHistory")
+            env.get("HOURS_TO_KEEP_SCOUTING_HISTORY") or config.get(USER_CFG_SECTION, "hourToKeepScoutHistory")
         )
 
+        # Move pruned scout history to the columnar archive instead of deleting it
+        self.ARCHIVE_SCOUT_HISTORY = (
+            env.get("ARCHIVE_SCOUT_HISTORY") or config.get(USER_CFG_SECTION, "archive_scout_history")
+        ).lower() in ("true", "yes", "1")
+
+        # Keep every value history entry in the compressed archive, before pruning thins them out in the database
+        self.ARCHIVE_VALUE_HISTORY = (
+            env.get("ARCHIVE_VALUE_HISTORY") or config.get(USER_CFG_SECTION, "archive_value_history")
+        ).lower() in ("true", "yes", "1")
+
         # Get config for scout
         self.SCOUT_TRANSACTION_FEE = float(
-            os.environ.get("SCOUT_TRANSACTION_FEE") or config.get(USER_CFG_SECTION, "scout_transaction_fee")
+            env.get("SCOUT_TRANSACTION_FEE") or config.get(USER_CFG_SECTION, "scout_transaction_fee")
+        )
+        self.SCOUT_MULTIPLIER = float(env.get("SCOUT_MULTIPLIER") or config.get(USER_CFG_SECTION, "scout_multiplier"))
+        self.SCOUT_SLEEP_TIME = float(env.get("SCOUT_SLEEP_TIME") or config.get(USER_CFG_SECTION, "scout_sleep_time"))
+
+        # Adapt the scouting interval between the min and max sleep times to how close we are to a jump
+        self.SCOUT_ADAPTIVE = (env.get("SCOUT_ADAPTIVE") or config.get(USER_CFG_SECTION, "scout_adaptive")).lower() in (
+            "true",
+            "yes",
+            "1",
         )
-        self.SCOUT_MULTIPLIER = float(
-            os.environ.get("SCOUT_MULTIPLIER") or config.get(USER_CFG_SECTION, "scout_multiplier")
+        self.SCOUT_MIN_SLEEP_TIME = float(
+            env.get("SCOUT_MIN_SLEEP_TIME") or config.get(USER_CFG_SECTION, "scout_min_sleep_time")
         )
-        self.SCOUT_SLEEP_TIME = int(
-            os.environ.get("SCOUT_SLEEP_TIME") or config.get(USER_CFG_SECTION, "scout_sleep_time")
+        self.SCOUT_MAX_SLEEP_TIME = float(
+            env.get("SCOUT_MAX_SLEEP_TIME") or config.get(USER_CFG_SECTION, "scout_max_sleep_time")
+        )
+
+        # Seconds to wait for a limit buy to fill before re-quoting it from the order book
+        self.BUY_TIMEOUT = float(env.get("BUY_TIMEOUT") or config.get(USER_CFG_SECTION, "buy_timeout"))
+
+        # Minutes of candles the thresholds of new pairs are computed from, or 0 for the current prices
+        self.THRESHOLD_SEED_MINUTES = int(
+            env.get("THRESHOLD_SEED_MINUTES") or config.get(USER_CFG_SECTION, "threshold_seed_minutes")
         )
 
         # Get config for binance
-        self.BINANCE_API_KEY = os.environ.get("API_KEY") or config.get(USER_CFG_SECTION, "api_key")
-        self.BINANCE_API_SECRET_KEY = os.environ.get("API_SECRET_KEY") or config.get(USER_CFG_SECTION, "api_secret_key")
-        self.BINANCE_TLD = os.environ.get("TLD") or config.get(USER_CFG_SECTION, "tld")
+        self.BINANCE_API_KEY = env.get("API_KEY") or config.get(USER_CFG_SECTION, "api_key")
+        self.BINANCE_API_SECRET_KEY = env.get("API_SECRET_KEY") or config.get(USER_CFG_SECTION, "api_secret_key")
+        self.BINANCE_TLD = env.get("TLD") or config.get(USER_CFG_SECTION, "tld")
+
+        self.DATABASE_PATH = env.get("DATABASE_PATH") or config.get(USER_CFG_SECTION, "database")
+
+        # Periodically copy the database for the API server to read from, so the dashboard never locks the bot out
+        self.READ_REPLICA = (env.get("READ_REPLICA") or config.get(USER_CFG_SECTION, "read_replica")).lower() in (
+            "true",
+            "yes",
+            "1",
+        )
+        self.READ_REPLICA_INTERVAL = float(
+            env.get("READ_REPLICA_INTERVAL") or config.get(USER_CFG_SECTION, "read_replica_interval")
+        )
+        self.READ_REPLICA_PATH = os.path.splitext(self.DATABASE_PATH)[0] + "_replica.db"
+
+        # The archives sit next to the database, so that every profile of the multi-account runner has its own
+        self.SCOUT_ARCHIVE_PATH = os.path.splitext(self.DATABASE_PATH)[0] + "_scout_history"
+        self.VALUE_ARCHIVE_PATH = os.path.splitext(self.DATABASE_PATH)[0] + "_value_history"
 
-        # Get supported coin list from the environment
+        # Record every ticker snapshot the bot fetches, to replay them later
+        self.RECORD_TICKERS = (env.get("RECORD_TICKERS") or config.get(USER_CFG_SECTION, "record_tickers")).lower() in (
+            "true",
+            "yes",
+            "1",
+        )
+
+        # Logging settings
+        self.LOG_JSON = (env.get("LOG_JSON") or config.get(USER_CFG_SECTION, "log_json")).lower() in (
+            "true",
+            "yes",
+            "1",
+        )
+        self.LOG_MAX_BYTES = int(env.get("LOG_MAX_BYTES") or config.get(USER_CFG_SECTION, "log_max_bytes"))
+        self.LOG_BACKUP_COUNT = int(env.get("LOG_BACKUP_COUNT") or config.get(USER_CFG_SECTION, "log_backup_count"))
+
+        # Seconds the sampling profiler runs for when started with SIGUSR1
+        self.PROFILE_SECONDS = float(env.get("PROFILE_SECONDS") or config.get(USER_CFG_SECTION, "profile_seconds"))
+
+        # Get supported coin list from the environment or the configuration file
         supported_coin_list = [
-            coin.strip() for coin in os.environ.get("SUPPORTED_COIN_LIST", "").split() if coin.strip()
+            coin.strip()
+            for coin in (env.get("SUPPORTED_COIN_LIST") or config.get(USER_CFG_SECTION, "supported_coin_list")).split()
+            if coin.strip()
         ]
         # Get supported coin list from supported_coin_list file
-        if not supported_coin_list and os.path.exists("supported_coin_list"):
-            with open("supported_coin_list") as rfh:
+        if not supported_coin_list and os.path.exists(SUPPORTED_COIN_LIST_FL_NAME):
+            with open(SUPPORTED_COIN_LIST_FL_NAME) as rfh:
                 for line in rfh:
                     line = line.strip()
                     if not line or line.startswith("#") or line in supported_coin_list:
@@ -65,4 +177,64 @@ class Config:  # pylint: disable=too-few-public-methods
                     supported_coin_list.append(line)
         self.SUPPORTED_COIN_LIST = supported_coin_list
 
-        self.CURRENT_COIN_SYMBOL = os.environ.get("CURRENT_COIN_SYMBOL") or config.get(USER_CFG_SECTION, "current_coin")
+        self.CURRENT_COIN_SYMBOL = env.get("CURRENT_COIN_SYMBOL") or config.get(USER_CFG_SECTION, "current_coin")
+
+    def reload(self) -> Tuple[Dict[str, Tuple[Any, Any]], List[str]]:
+        """
+        Read the configuration again and take over the reloadable settings that changed. Returns the (old, new)
+        values of the settings that were applied, and the names of the ones that changed but need a restart.
+        """
+        reloaded = Config(self.config_file, self.use_environment, self.defaults)
+        changed = {
+            name: (value, getattr(reloaded, name))
+            for name, value in vars(self).items()
+            if name != "BRIDGE" and getattr(reloaded, name) != value
+        }
+        applied = {name: values for name, values in changed.items() if name in RELOADABLE_SETTINGS}
+        for name, (_, value) in applied.items():
+            setattr(self, name, value)
+        return applied, sorted(changed.keys() - applied.keys())
+
+
+def request_reload():
+    """
+    Ask every ConfigWatcher to reload on its next check, whether the files changed or not
+    """
+    global _reload_requests  # pylint: disable=global-statement
+    _reload_requests += 1
+
+
+class ConfigWatcher:
+    """
+    Reloads a Config when its files change or a reload is requested, and passes the applied changes on
+    """
+
+    def __init__(self, config: Config, logger, on_change: Callable[[Dict[str, Tuple[Any, Any]]], None]):
+        self.config = config
+        self.logger = logger
+        self.on_change = on_change
+        self.paths = [config.config_file, SUPPORTED_COIN_LIST_FL_NAME]
+        self._mtimes = self._read_mtimes()
+        self._reload_requests = _reload_requests
+
+    def _read_mtimes(self):
+        return [os.path.getmtime(path) if os.path.exists(path) else None for path in self.paths]
+
+    def check(self):
+        mtimes = self._read_mtimes()
+        if mtimes == self._mtimes and self._reload_requests == _reload_requests:
+            return
+        self._mtimes = mtimes
+        self._reload_requests = _reload_requests
+
+        try:
+            applied, ignored = self.config.reload()
+        except Exception as e:  # pylint: disable=broad-except
+            self.logger.error(f"Unable to reload the configuration, keeping the current one: {e}")
+            return
+        if ignored:
+            self.logger.warning(f"Restart the bot to apply the new {', '.join(ignored)}")
+        if not applied:
+            return
+        self.logger.info(f"Reloaded configuration: {', '.join(sorted(applied))} changed")
+        self.on_change(applied)
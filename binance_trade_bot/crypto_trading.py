@@ -1,38 +1,167 @@
 #!python3
+import datetime
+import signal
+import sys
+import threading
 import time
 
 from .auto_trader import AutoTrader
 from .binance_api_manager import BinanceAPIManager
-from .config import Config
+from .config import Config, ConfigWatcher, request_reload
 from .database import Database
 from .logger import Logger
+from .market_data import MarketDataCache
+from .profiler import SamplingProfiler
 from .scheduler import SafeScheduler
+from .state import STATE_SNAPSHOT_PATH, StateSnapshot
 
+# Seconds between two checks of whether the configuration files changed
+CONFIG_WATCH_INTERVAL = 5
 
-def main():
-    logger = Logger()
-    logger.info("Starting")
 
-    config = Config()
+class StartupTimer:
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+        self.phases = []
+
+    def phase(self, name: str):
+        now = time.perf_counter()
+        self.phases.append((name, now - self.last))
+        self.last = now
+
+    def __str__(self):
+        phases = ", ".join(f"{name} {duration:.2f}s" for name, duration in self.phases)
+        return f"{self.last - self.start:.2f}s ({phases})"
+
+
+def setup_bot(logger: Logger, config: Config, market_data: MarketDataCache = None, state_path=STATE_SNAPSHOT_PATH):
+    """
+    Prepare the database and trader of a bot and schedule its jobs. Returns the scheduler and a function that saves
+    the state snapshot on shutdown.
+    """
+    timer = StartupTimer()
     db = Database(logger, config)
-    manager = BinanceAPIManager(config, db, logger)
+    manager = BinanceAPIManager(config, db, logger, market_data)
     trader = AutoTrader(manager, db, logger, config)
+    snapshot = StateSnapshot(logger, config, state_path)
+    timer.phase("binance client")
 
     logger.info("Creating database schema if it doesn't already exist")
     db.create_database()
+    timer.phase("database")
 
-    db.set_coins(config.SUPPORTED_COIN_LIST)
+    loaded = snapshot.load()
+    warm_start = loaded and snapshot.is_complete(db)
+    if warm_start:
+        logger.info("Warm start from state snapshot, coins and thresholds are already set up")
+    else:
+        db.set_coins(config.SUPPORTED_COIN_LIST)
     db.migrate_old_state()
+    db.rebuild_portfolio_stats()
+    timer.phase("coins")
 
-    trader.initialize_trade_thresholds()
+    if not warm_start:
+        trader.initialize_trade_thresholds(snapshot.get_prices())
+    timer.phase("thresholds")
+    if loaded:
+        bought = snapshot.restore(db, manager, trader.executor)
+        if bought is not None:
+            trader.update_trade_threshold(db.get_current_coin(), float(bought["price"]), manager.get_market_prices())
     trader.initialize_current_coin()
+    timer.phase("current coin")
+    logger.info(f"Ready to scout after {timer}", False)
 
     schedule = SafeScheduler(logger)
-    schedule.every(config.SCOUT_SLEEP_TIME).seconds.do(trader.scout).tag("scouting")
-    schedule.every(1).minutes.do(trader.update_values).tag("updating value history")
-    schedule.every(1).minutes.do(db.prune_scout_history).tag("pruning scout history")
-    schedule.every(1).hours.do(db.prune_value_history).tag("pruning value history")
 
-    while True:
+    def scout():
+        trader.scout()
+        if config.SCOUT_ADAPTIVE:
+            scout_job.set_interval(trader.get_scout_interval(scout_job.interval))
+
+    # Jobs that call the exchange but can wait are paused while it is failing, trades in flight are finished though
+    exchange_failing = manager.retrier.breaker.is_open
+    scout_job = schedule.every(config.SCOUT_SLEEP_TIME).seconds.do(scout).tag("scouting").paused_while(exchange_failing)
+    # Jobs using the Binance manager or the socket.io client stay on the main loop, only database maintenance and
+    # reports run in the background
+    value_job = schedule.every(1).minutes.do(trader.update_values).tag("updating value history")
+    value_job.paused_while(exchange_failing)
+    schedule.every(1).minutes.do(db.prune_scout_history).tag("pruning scout history").in_background()
+    schedule.every(1).hours.do(db.prune_value_history).tag("pruning value history").in_background()
+    if config.READ_REPLICA:
+        replica_job = schedule.every(config.READ_REPLICA_INTERVAL).seconds.do(db.refresh_read_replica)
+        replica_job.tag("refreshing read replica").in_background()
+        # Give the API server a replica to read from right away
+        replica_job.next_run = datetime.datetime.now()
+    # Sub-second and adaptive scouting report their stats more often, to check that the loop keeps up
+    def report_every():
+        return 1 if config.SCOUT_ADAPTIVE or config.SCOUT_SLEEP_TIME < 1 else 60
+
+    report_jobs = [
+        schedule.every(report_every()).minutes.do(schedule.report).tag("reporting scheduler stats").in_background(),
+        schedule.every(report_every()).minutes.do(manager.retrier.report).tag("reporting API stats").in_background(),
+    ]
+
+    # Don't wait a whole interval before the first scout
+    scout_job.next_run = datetime.datetime.now()
+
+    def apply_config(changes: dict):
+        if "SUPPORTED_COIN_LIST" in changes:
+            old, new = changes["SUPPORTED_COIN_LIST"]
+            # Disabling the coin we hold would leave the bot without any pair to scout from
+            current_coin = db.get_current_coin()
+            if current_coin is not None and current_coin.symbol not in new:
+                logger.warning(
+                    f"Keeping {current_coin.symbol} enabled as it is the current coin, reload again once the bot "
+                    "jumped to another coin to remove it"
+                )
+                new = config.SUPPORTED_COIN_LIST = new + [current_coin.symbol]
+            logger.info(f"Coins added: {sorted(set(new) - set(old))}, removed: {sorted(set(old) - set(new))}")
+            db.set_coins(config.SUPPORTED_COIN_LIST)
+            trader.initialize_trade_thresholds()
+        if changes.keys() & {"SCOUT_TRANSACTION_FEE", "SCOUT_MULTIPLIER"}:
+            trader.forget_scores()
+        if changes.keys() & {"SCOUT_SLEEP_TIME", "SCOUT_ADAPTIVE"}:
+            if not config.SCOUT_ADAPTIVE:
+                scout_job.set_interval(config.SCOUT_SLEEP_TIME)
+            for job in report_jobs:
+                job.set_interval(report_every())
+                # Don't wait out the rest of an hourly interval before reporting every minute
+                job.next_run = min(job.next_run, datetime.datetime.now() + datetime.timedelta(minutes=job.interval))
+
+    # Runs in the main loop like scouting, so a reload never happens in the middle of a scout
+    watcher = ConfigWatcher(config, logger, apply_config)
+    schedule.every(CONFIG_WATCH_INTERVAL).seconds.do(watcher.check).tag("watching configuration")
+
+    def save_state():
+        logger.info("Saving state snapshot")
+        snapshot.save(db, manager, trader.executor, trader.last_prices)
+
+    return schedule, save_state
+
+
+def run_bot(schedule: SafeScheduler, stop: threading.Event = None):
+    while stop is None or not stop.is_set():
         schedule.run_pending()
-        time.sleep(1)
+        # Sleep until the next job is due rather than a fixed second, but wake up at least once a second to check
+        # whether we should stop
+        time.sleep(min(max(schedule.idle_seconds, 0), 1))
+
+
+def main():
+    config = Config()
+
+    logger = Logger(json_lines=config.LOG_JSON, max_bytes=config.LOG_MAX_BYTES, backup_count=config.LOG_BACKUP_COUNT)
+    logger.info("Starting")
+
+    schedule, save_state = setup_bot(logger, config)
+
+    # Turn SIGTERM (e.g. `docker stop`) into a regular exit, so the state snapshot below gets written
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    signal.signal(signal.SIGHUP, lambda signum, frame: request_reload())
+    profiler = SamplingProfiler(logger, schedule.running_jobs)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.start(config.PROFILE_SECONDS))
+
+    try:
+        run_bot(schedule)
+    finally:
+        save_state()
@@ -1,29 +1,49 @@
 import json
 import os
+import sqlite3
 import time
-from contextlib import contextmanager
+from contextlib import closing, contextmanager
 from datetime import datetime, timedelta
-from typing import List, Optional, Union
+from itertools import groupby
+from typing import Dict, List, Optional, Tuple, Union
 
-from socketio import Client
-from socketio.exceptions import ConnectionError as SocketIOConnectionError
-from sqlalchemy import create_engine, func
+from sqlalchemy import and_, create_engine, func, or_
 from sqlalchemy.orm import Session, scoped_session, sessionmaker
 
 from .config import Config
 from .logger import Logger
+from .market import CoinInfo, PairInfo
 from .models import *  # pylint: disable=wildcard-import
+from .scout_archive import ScoutHistoryArchive
+from .value_archive import ValueHistoryArchive
 
 
 class Database:
-    def __init__(self, logger: Logger, config: Config, uri="sqlite:///data/crypto_trading.db"):
+    def __init__(self, logger: Logger, config: Config, uri=None):
         self.logger = logger
         self.config = config
-        self.engine = create_engine(uri)
+        # Maintenance jobs write from the scheduler's worker threads, wait for their transactions rather than fail
+        self.engine = create_engine(uri or f"sqlite:///{config.DATABASE_PATH}", connect_args={"timeout": 30})
         self.SessionMaker = sessionmaker(bind=self.engine)
-        self.socketio_client = Client()
+        self._socketio_client = None
+        self.scout_archive = ScoutHistoryArchive(config.SCOUT_ARCHIVE_PATH)
+        self.value_archive = ValueHistoryArchive(config.VALUE_ARCHIVE_PATH)
+        self._pair_graph: Optional[Dict[str, List[PairInfo]]] = None
+
+    @property
+    def socketio_client(self):
+        # Only pay for importing the socket.io client once there is something to send
+        if self._socketio_client is None:
+            from socketio import Client  # pylint: disable=import-outside-toplevel
+
+            self._socketio_client = Client()
+        return self._socketio_client
 
     def socketio_connect(self):
+        from socketio.exceptions import (  # pylint: disable=import-outside-toplevel
+            ConnectionError as SocketIOConnectionError,
+        )
+
         if self.socketio_client.connected and self.socketio_client.namespaces:
             return True
         try:
@@ -69,12 +89,12 @@ class Database:
         # For all the combinations of coins in the database, add a pair to the database
         with self.db_session() as session:
             coins: List[Coin] = session.query(Coin).filter(Coin.enabled).all()
+            existing = set(session.query(Pair.from_coin_id, Pair.to_coin_id))
             for from_coin in coins:
                 for to_coin in coins:
-                    if from_coin != to_coin:
-                        pair = session.query(Pair).filter(Pair.from_coin == from_coin, Pair.to_coin == to_coin).first()
-                        if pair is None:
-                            session.add(Pair(from_coin, to_coin))
+                    if from_coin != to_coin and (from_coin.symbol, to_coin.symbol) not in existing:
+                        session.add(Pair(from_coin, to_coin))
+        self.invalidate_pair_graph()
 
     def get_coin(self, coin: Union[Coin, str]) -> Coin:
         if isinstance(coin, Coin):
@@ -114,32 +134,106 @@ class Database:
             session.expunge(pair)
             return pair
 
-    def get_pairs_from(self, from_coin: Union[Coin, str]):
-        from_coin = self.get_coin(from_coin)
-        session: Session
-        with self.db_session() as session:
-            pairs: List[Pair] = session.query(Pair).filter(Pair.from_coin == from_coin)
-            return pairs
+    def get_pair_graph(self) -> Dict[str, List[PairInfo]]:
+        """
+        Pairs to every enabled coin, keyed by the symbol of the coin they are from. Loaded once, and again only after
+        the coins or the ratios changed.
+        """
+        graph = self._pair_graph
+        if graph is None:
+            session: Session
+            with self.db_session() as session:
+                coins = {
+                    symbol: CoinInfo(symbol, enabled) for symbol, enabled in session.query(Coin.symbol, Coin.enabled)
+                }
+                rows = session.query(Pair.id, Pair.from_coin_id, Pair.to_coin_id, Pair.ratio).all()
+            graph = {}
+            for pair_id, from_symbol, to_symbol, ratio in rows:
+                if coins[to_symbol].enabled:
+                    graph.setdefault(from_symbol, []).append(
+                        PairInfo(pair_id, coins[from_symbol], coins[to_symbol], ratio)
+                    )
+            self._pair_graph = graph
+        return graph
+
+    def invalidate_pair_graph(self):
+        self._pair_graph = None
+
+    def get_market_pairs_from(self, from_coin: Union[Coin, str]) -> List[PairInfo]:
+        """
+        Pairs from a coin to every enabled coin, served from the pair graph instead of the database
+        """
+        symbol = from_coin.symbol if isinstance(from_coin, Coin) else from_coin
+        return self.get_pair_graph().get(symbol, [])
 
     def log_scout(
         self,
-        pair: Pair,
+        pair: Union[Pair, PairInfo],
         target_ratio: float,
         current_coin_price: float,
         other_coin_price: float,
     ):
+        self.log_scouts([(pair, target_ratio, current_coin_price, other_coin_price)])
+
+    def log_scouts(self, rows: List[Tuple[Union[Pair, PairInfo], float, float, float]]):
+        """
+        Log the (pair, target_ratio, current_coin_price, other_coin_price) rows of a scout in a single transaction
+        """
+        if not rows:
+            return
         session: Session
         with self.db_session() as session:
-            pair = session.merge(pair)
-            sh = ScoutHistory(pair, target_ratio, current_coin_price, other_coin_price)
-            session.add(sh)
-            self.send_update(sh)
+            pairs = {pair.id: pair for pair in session.query(Pair).filter(Pair.id.in_({row[0].id for row in rows}))}
+            history = [
+                ScoutHistory(pairs[pair.id], target_ratio, current_coin_price, other_coin_price)
+                for pair, target_ratio, current_coin_price, other_coin_price in rows
+            ]
+            session.add_all(history)
+            self.send_updates(history)
 
     def prune_scout_history(self):
         time_diff = datetime.now() - timedelta(hours=self.config.SCOUT_HISTORY_PRUNE_TIME)
         session: Session
+        rows = []
         with self.db_session() as session:
-            session.query(ScoutHistory).filter(ScoutHistory.datetime < time_diff).delete()
+            query = session.query(ScoutHistory).filter(ScoutHistory.datetime < time_diff)
+            if self.config.ARCHIVE_SCOUT_HISTORY:
+                rows = query.with_entities(
+                    ScoutHistory.datetime,
+                    ScoutHistory.pair_id,
+                    ScoutHistory.target_ratio,
+                    ScoutHistory.current_coin_price,
+                    ScoutHistory.other_coin_price,
+                ).all()
+            query.delete()
+        # Only archive once the delete went through, or rows it failed to delete would be archived again next time
+        if rows:
+            self.scout_archive.append(rows)
+
+    def archive_value_history(self, session: Session, until: datetime):
+        """
+        Add the entries before `until` that aren't archived yet to the value history archive
+        """
+        archived_until = {coin: self.value_archive.last(coin) for coin in self.value_archive.coins()}
+        archived_until = {coin: last for coin, last in archived_until.items() if last is not None}
+        # Coins without an archive yet, e.g. the first time or coins added since, get whatever pruning kept of their
+        # history
+        query = session.query(
+            CoinValue.coin_id, CoinValue.datetime, CoinValue.balance, CoinValue.usd_price, CoinValue.btc_price
+        ).filter(
+            CoinValue.datetime < until,
+            or_(
+                CoinValue.coin_id.notin_(archived_until),
+                *(and_(CoinValue.coin_id == coin, CoinValue.datetime > last) for coin, last in archived_until.items()),
+            ),
+        )
+
+        rows = sorted(query.all(), key=lambda row: row[0])
+        for coin, coin_rows in groupby(rows, key=lambda row: row[0]):
+            last = archived_until.get(coin)
+            self.value_archive.append(
+                coin, [row[1:] for row in coin_rows if last is None or row[1].replace(microsecond=0) > last]
+            )
 
     def prune_value_history(self):
         session: Session
@@ -169,6 +263,8 @@ class Database:
             # The last 24 hours worth of minutely entries will be kept, so
             # count(coins) * 1440 entries
             time_diff = datetime.now() - timedelta(hours=24)
+            if self.config.ARCHIVE_VALUE_HISTORY:
+                self.archive_value_history(session, time_diff)
             session.query(CoinValue).filter(
                 CoinValue.interval == Interval.MINUTELY, CoinValue.datetime < time_diff
             ).delete()
@@ -189,10 +285,116 @@ class Database:
 
     def create_database(self):
         Base.metadata.create_all(self.engine)
+        self.migrate_trade_states()
+        if self.config.READ_REPLICA:
+            # In WAL mode, copying the database to the replica doesn't block the bot's writes
+            with self.engine.connect() as connection:
+                connection.execute("PRAGMA journal_mode=WAL")
+
+    def migrate_trade_states(self):
+        """
+        Databases created before trades could fail have a constraint on the trade states that rejects FAILED. SQLite
+        can't alter a constraint, so copy the trades over to a table created with the current one.
+        """
+        with self.engine.begin() as connection:
+            table_sql = connection.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'trade_history'"
+            ).scalar()
+            if table_sql is None or "CONSTRAINT tradestate" not in table_sql or "'FAILED'" in table_sql:
+                return
+            self.logger.info("Allowing failed trades in trade_history")
+            columns = ", ".join(column.name for column in Trade.__table__.columns)
+            connection.execute("ALTER TABLE trade_history RENAME TO trade_history_old")
+            Trade.__table__.create(connection)
+            connection.execute(f"INSERT INTO trade_history ({columns}) SELECT {columns} FROM trade_history_old")
+            connection.execute("DROP TABLE trade_history_old")
+
+    def refresh_read_replica(self):
+        """
+        Copy the database to the read replica with SQLite's online backup, replacing the previous copy atomically
+        """
+        tmp_path = self.config.READ_REPLICA_PATH + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        source = self.engine.raw_connection()
+        try:
+            with closing(sqlite3.connect(tmp_path)) as target:
+                source.connection.backup(target)
+                # The API server opens the replica read-only, which needs a rollback journal rather than WAL
+                target.execute("PRAGMA journal_mode=DELETE")
+        finally:
+            source.close()
+        os.replace(tmp_path, self.config.READ_REPLICA_PATH)
 
     def start_trade_log(self, from_coin: Coin, to_coin: Coin, selling: bool):
         return TradeLog(self, from_coin, to_coin, selling)
 
+    def resume_trade_log(self, trade_id: int) -> Optional["TradeLog"]:
+        session: Session
+        with self.db_session() as session:
+            trade: Trade = session.query(Trade).get(trade_id)
+            if trade is None or trade.state in (TradeState.COMPLETE, TradeState.FAILED):
+                return None
+            session.expunge(trade)
+            return TradeLog.from_trade(self, trade)
+
+    def get_last_trade(self) -> Optional[Trade]:
+        session: Session
+        with self.db_session() as session:
+            trade: Trade = session.query(Trade).order_by(Trade.datetime.desc()).first()
+            if trade is not None:
+                session.expunge(trade)
+            return trade
+
+    def record_trade_stats(self, session: Session, trade: Trade):
+        stats = session.query(CoinStats).get(trade.alt_coin_id)
+        if stats is None:
+            stats = CoinStats(trade.alt_coin_id)
+            session.add(stats)
+        stats.record_trade(trade, self.config.SCOUT_TRANSACTION_FEE)
+
+    def record_portfolio_value(self, session: Session, values: List[CoinValue], at: datetime):
+        # A partial total would look like a crash of the portfolio and set the max drawdown for good
+        if not values or any(cv.usd_value is None for cv in values):
+            return
+        stats = session.query(PortfolioStats).get(1)
+        if stats is None:
+            stats = PortfolioStats()
+            session.add(stats)
+        stats.record_value(sum(cv.usd_value for cv in values), at)
+
+    def rebuild_portfolio_stats(self):
+        """
+        Build the portfolio stats from the whole trade and value history, if they have never been built. From then on
+        they are kept up to date as trades complete and values are recorded.
+        """
+        session: Session
+        with self.db_session() as session:
+            if session.query(PortfolioStats).get(1) is not None:
+                return
+            session.query(CoinStats).delete()
+            trades = (
+                session.query(Trade)
+                .filter(Trade.state == TradeState.COMPLETE, Trade.crypto_trade_amount.isnot(None))
+                .order_by(Trade.datetime.asc())
+            )
+            for trade in trades:
+                self.record_trade_stats(session, trade)
+                session.flush()
+
+            stats = PortfolioStats()
+            # Only the times every value has a USD price at, like the values recorded from now on
+            totals = (
+                session.query(CoinValue.datetime, func.sum(CoinValue.usd_value))
+                .group_by(CoinValue.datetime)
+                .having(func.count(CoinValue.usd_value) == func.count())
+                .order_by(CoinValue.datetime.asc())
+            )
+            for at, usd_value in totals:
+                stats.record_value(usd_value, at)
+            session.add(stats)
+        self.logger.info("Built portfolio stats from the trade and value history", False)
+
     def send_update(self, model):
         if not self.socketio_connect():
             return
@@ -203,6 +405,19 @@ class Database:
             namespace="/backend",
         )
 
+    def send_updates(self, models: list):
+        """
+        Send several rows of the same table in a single event, which the API server relays as one update per row
+        """
+        if not models or not self.socketio_connect():
+            return
+
+        self.socketio_client.emit(
+            "updates",
+            {"table": models[0].__tablename__, "data": [model.info() for model in models]},
+            namespace="/backend",
+        )
+
     def migrate_old_state(self):
         """
         For migrating from old dotfile format to SQL db. This method should be removed in
@@ -229,6 +444,7 @@ class Database:
                             pair = session.merge(self.get_pair(from_coin, to_coin))
                             pair.ratio = ratio
                             session.add(pair)
+                self.invalidate_pair_graph()
 
             os.rename(".current_coin_table", ".current_coin_table.old")
             self.logger.info(".current_coin_table renamed to .current_coin_table.old - " "You can now delete this file")
@@ -245,8 +461,22 @@ class TradeLog:
             session.add(self.trade)
             # Flush so that SQLAlchemy fills in the id column
             session.flush()
+            self.trade_id = self.trade.id
+            self.selling = selling
             self.db.send_update(self.trade)
 
+    @classmethod
+    def from_trade(cls, db: Database, trade: Trade):
+        """
+        Wrap an already existing trade, e.g. one that was still in flight when the bot stopped
+        """
+        trade_log = cls.__new__(cls)
+        trade_log.db = db
+        trade_log.trade = trade
+        trade_log.trade_id = trade.id
+        trade_log.selling = trade.selling
+        return trade_log
+
     def set_ordered(self, alt_starting_balance, crypto_starting_balance, alt_trade_amount):
         session: Session
         with self.db.db_session() as session:
@@ -263,6 +493,19 @@ class TradeLog:
             trade: Trade = session.merge(self.trade)
             trade.crypto_trade_amount = crypto_trade_amount
             trade.state = TradeState.COMPLETE
+            self.db.record_trade_stats(session, trade)
+            self.db.send_update(trade)
+
+    def set_failed(self, alt_trade_amount, crypto_trade_amount):
+        """
+        The order ended without filling completely, record what it did fill
+        """
+        session: Session
+        with self.db.db_session() as session:
+            trade: Trade = session.merge(self.trade)
+            trade.alt_trade_amount = alt_trade_amount
+            trade.crypto_trade_amount = crypto_trade_amount
+            trade.state = TradeState.FAILED
             self.db.send_update(trade)
 
 
@@ -0,0 +1,87 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Deque, Optional, Tuple
+
+from .binance_api_manager import BinanceAPIManager
+from .config import Config
+from .logger import Logger
+from .market import MarketPrices
+from .models import Coin
+
+
+class JumpExecutor:
+    """
+    Runs a jump as a pipeline: the buy is prepared while the sell is in flight, and placed as soon as the sell is
+    filled, with the balance the sell is known to have brought instead of waiting for the account to show it.
+    """
+
+    # Number of recent jumps the latency stats are computed over
+    LATENCY_HISTORY = 100
+
+    def __init__(self, manager: BinanceAPIManager, logger: Logger, config: Config):
+        self.manager = manager
+        self.logger = logger
+        self.config = config
+        self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="execution")
+        # (sell, buy, total) seconds of the recent jumps
+        self.latencies: Deque[Tuple[float, float, float]] = deque(maxlen=self.LATENCY_HISTORY)
+        # Coin of a jump whose sell went through but whose buy kept failing, the bridge is held until it is bought
+        self.unfinished_buy: Optional[Coin] = None
+
+    def jump(self, from_coin: Coin, to_coin: Coin, prices: MarketPrices) -> Optional[dict]:
+        """
+        Sell `from_coin` for the bridge and buy `to_coin` with it. Returns the buy order, or None if the sell failed.
+        """
+        start = time.perf_counter()
+        preparing = self.pool.submit(self.manager.prepare_buy, to_coin, self.config.BRIDGE)
+
+        sold = self.manager.sell_alt(from_coin, self.config.BRIDGE, to_coin)
+        if sold is None:
+            return None
+        sold_at = time.perf_counter()
+        # Until the buy goes through we hold the bridge, which the state snapshot has to know if the bot stops
+        self.unfinished_buy = to_coin
+
+        try:
+            prepared = preparing.result()
+        except Exception as e:  # pylint: disable=broad-except
+            self.logger.info(f"Unable to prepare the buy of {to_coin.symbol}: {e}")
+            prepared = None
+
+        # buy_alt retries with its own policy, past that don't hold up the loop but try again on the next scout
+        result = self.manager.buy_alt(to_coin, self.config.BRIDGE, prices, prepared, sold["target_balance"])
+        if result is None:
+            self.logger.error(
+                f"Sold {from_coin.symbol} but couldn't buy {to_coin.symbol}, holding {self.config.BRIDGE.symbol} "
+                f"and trying again on the next scout"
+            )
+            return None
+        self.unfinished_buy = None
+        done_at = time.perf_counter()
+
+        self.latencies.append((sold_at - start, done_at - sold_at, done_at - start))
+        self.logger.info(
+            f"Jumped from {from_coin.symbol} to {to_coin.symbol} in {done_at - start:.2f}s "
+            f"(sell {sold_at - start:.2f}s, buy {done_at - sold_at:.2f}s, "
+            f"{self.mean_latency():.2f}s mean over the last {len(self.latencies)} jumps)"
+        )
+        return result
+
+    def finish_buy(self, prices: MarketPrices) -> Optional[dict]:
+        """
+        Try again to buy the coin of the jump whose buy failed. Returns the buy order, or None if it failed again.
+        """
+        to_coin = self.unfinished_buy
+        result = self.manager.buy_alt(to_coin, self.config.BRIDGE, prices)
+        if result is None:
+            self.logger.info(f"Couldn't buy {to_coin.symbol}, still holding {self.config.BRIDGE.symbol}")
+            return None
+        self.unfinished_buy = None
+        self.logger.info(f"Bought {to_coin.symbol}, finishing the jump")
+        return result
+
+    def mean_latency(self):
+        if not self.latencies:
+            return 0.0
+        return sum(total for _, _, total in self.latencies) / len(self.latencies)
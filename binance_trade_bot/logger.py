@@ -1,34 +1,57 @@
+import atexit
+import json
 import logging.handlers
+import queue
 
 from .notifications import NotificationHandler
 
 
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(
+            {
+                "time": self.formatTime(record),
+                "name": record.name,
+                "level": record.levelname,
+                "message": record.getMessage(),
+            }
+        )
+
+
 class Logger:
 
     Logger = None
     NotificationHandler = None
 
-    def __init__(self, logging_service="crypto_trading"):
+    def __init__(self, logging_service="crypto_trading", json_lines=False, max_bytes=10 * 1024 * 1024, backup_count=5):
         # Logger setup
         self.Logger = logging.getLogger(f"{logging_service}_logger")
         self.Logger.setLevel(logging.DEBUG)
         formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
         # default is "logs/crypto_trading.log"
-        fh = logging.FileHandler(f"logs/{logging_service}.log")
+        fh = logging.handlers.RotatingFileHandler(
+            f"logs/{logging_service}.log", maxBytes=max_bytes, backupCount=backup_count
+        )
         fh.setLevel(logging.DEBUG)
-        fh.setFormatter(formatter)
-        self.Logger.addHandler(fh)
+        fh.setFormatter(JsonFormatter() if json_lines else formatter)
 
         # logging to console
         ch = logging.StreamHandler()
         ch.setLevel(logging.DEBUG)
         ch.setFormatter(formatter)
-        self.Logger.addHandler(ch)
+
+        # The trading loop only puts records on a queue, the file and console writes happen in the listener thread.
+        # Messages are formatted before they are queued though, so they show objects as they were when logged.
+        log_queue = queue.Queue()
+        self.Logger.addHandler(logging.handlers.QueueHandler(log_queue))
+        self.listener = logging.handlers.QueueListener(log_queue, fh, ch, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.listener.stop)
 
         # notification handler
         self.NotificationHandler = NotificationHandler()
 
-    def log(self, message, level="info", notification=True):
+    def log(self, message, level="info", notification=True, urgent=False):
 
         if level == "info":
             self.Logger.info(message)
@@ -40,16 +63,16 @@ class Logger:
             self.Logger.debug(message)
 
         if notification and self.NotificationHandler.enabled:
-            self.NotificationHandler.send_notification(message)
+            self.NotificationHandler.send_notification(message, urgent=urgent)
 
-    def info(self, message, notification=True):
-        self.log(message, "info", notification)
+    def info(self, message, notification=True, urgent=False):
+        self.log(message, "info", notification, urgent)
 
-    def warning(self, message, notification=True):
-        self.log(message, "warning", notification)
+    def warning(self, message, notification=True, urgent=True):
+        self.log(message, "warning", notification, urgent)
 
-    def error(self, message, notification=True):
-        self.log(message, "error", notification)
+    def error(self, message, notification=True, urgent=True):
+        self.log(message, "error", notification, urgent)
 
     def debug(self, message, notification=True):
         self.log(message, "debug", notification)
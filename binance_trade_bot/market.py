@@ -0,0 +1,172 @@
+import math
+import sys
+import time
+from array import array
+from typing import Dict, List, Optional, Union
+
+from .models import Coin, Pair
+
+
+class SymbolTable:
+    """
+    Interns ticker symbols and gives each one a stable index into the price arrays. Adding symbols isn't thread safe,
+    whoever shares a table must serialize the calls to `index`.
+    """
+
+    __slots__ = ("_indexes", "_symbols")
+
+    def __init__(self):
+        self._indexes: Dict[str, int] = {}
+        self._symbols: List[str] = []
+
+    def index(self, symbol: str) -> int:
+        index = self._indexes.get(symbol)
+        if index is None:
+            symbol = sys.intern(symbol)
+            index = len(self._symbols)
+            self._symbols.append(symbol)
+            self._indexes[symbol] = index
+        return index
+
+    def find(self, symbol: str) -> Optional[int]:
+        return self._indexes.get(symbol)
+
+    def __getitem__(self, index: int) -> str:
+        return self._symbols[index]
+
+    def __len__(self):
+        return len(self._symbols)
+
+
+class MarketPrices:
+    """
+    Every ticker price of the market at one point in time, parsed once into a float64 array indexed by a SymbolTable.
+    Symbols without a price are NaN in the array and None through `get`. Each symbol also has a version number, which
+    goes up with every snapshot its price changed in, so consumers can tell what moved since the snapshot they last saw.
+    """
+
+    __slots__ = ("symbols", "prices", "versions", "timestamp")
+
+    def __init__(self, symbols: SymbolTable, prices: array, timestamp: float, versions: array = None):
+        self.symbols = symbols
+        self.prices = prices
+        self.versions = array("Q", [0]) * len(prices) if versions is None else versions
+        self.timestamp = timestamp
+
+    @classmethod
+    def from_tickers(
+        cls,
+        all_tickers: List[dict],
+        symbols: SymbolTable = None,
+        timestamp: float = None,
+        previous: "MarketPrices" = None,
+    ):
+        """
+        Parse the tickers returned by the Binance API. The versions carry on from the `previous` snapshot, which
+        must share the symbol table.
+        """
+        if symbols is None:
+            symbols = SymbolTable()
+        indexes = [symbols.index(ticker["symbol"]) for ticker in all_tickers]
+        prices = array("d", [math.nan]) * len(symbols)
+        for index, ticker in zip(indexes, all_tickers):
+            prices[index] = float(ticker["price"])
+
+        if previous is None:
+            versions = None
+        else:
+            versions = previous.versions + array("Q", [0]) * (len(prices) - len(previous.versions))
+            old_prices = previous.prices
+            for index, price in enumerate(prices):
+                # NaN != NaN, so compare missing prices separately
+                if index >= len(old_prices) or (
+                    price != old_prices[index] and not (math.isnan(price) and math.isnan(old_prices[index]))
+                ):
+                    versions[index] += 1
+        return cls(symbols, prices, time.time() if timestamp is None else timestamp, versions)
+
+    def get(self, symbol: str) -> Optional[float]:
+        index = self.symbols.find(symbol)
+        # Symbols added to a shared table after this snapshot was taken are past the end of its array
+        if index is None or index >= len(self.prices):
+            return None
+        price = self.prices[index]
+        return None if math.isnan(price) else price
+
+    def version(self, symbol: str) -> int:
+        index = self.symbols.find(symbol)
+        if index is None or index >= len(self.versions):
+            return 0
+        return self.versions[index]
+
+    def __contains__(self, symbol: str):
+        return self.get(symbol) is not None
+
+    def age(self) -> float:
+        return time.time() - self.timestamp
+
+    def to_tickers(self) -> List[dict]:
+        """
+        Convert back to the format of the Binance API, e.g. to store it as JSON
+        """
+        return [
+            {"symbol": self.symbols[index], "price": repr(price)}
+            for index, price in enumerate(self.prices)
+            if not math.isnan(price)
+        ]
+
+
+class CoinInfo:
+    """
+    Read-only view of a coin, cheaper to create and pass around than the Coin model
+    """
+
+    __slots__ = ("symbol", "enabled")
+
+    def __init__(self, symbol: str, enabled: bool = True):
+        self.symbol = symbol
+        self.enabled = enabled
+
+    def __add__(self, other: Union[str, Coin, "CoinInfo"]):
+        if isinstance(other, str):
+            return self.symbol + other
+        if isinstance(other, (Coin, CoinInfo)):
+            return self.symbol + other.symbol
+        raise TypeError(f"unsupported operand type(s) for +: 'CoinInfo' and '{type(other)}'")
+
+    def __repr__(self):
+        return f"<{self.symbol}>"
+
+
+class PairInfo:
+    """
+    Read-only view of a pair, with the same attributes as the Pair model that scouting relies on
+    """
+
+    __slots__ = ("id", "from_coin", "to_coin", "ratio")
+
+    def __init__(self, pair_id: int, from_coin: CoinInfo, to_coin: CoinInfo, ratio: Optional[float]):
+        self.id = pair_id
+        self.from_coin = from_coin
+        self.to_coin = to_coin
+        self.ratio = ratio
+
+    @classmethod
+    def from_model(cls, pair: Pair):
+        return cls(
+            pair.id,
+            CoinInfo(pair.from_coin.symbol, pair.from_coin.enabled),
+            CoinInfo(pair.to_coin.symbol, pair.to_coin.enabled),
+            pair.ratio,
+        )
+
+    @property
+    def from_coin_id(self):
+        return self.from_coin.symbol
+
+    @property
+    def to_coin_id(self):
+        return self.to_coin.symbol
+
+    def __repr__(self):
+        return f"<{self.from_coin_id}->{self.to_coin_id} :: {self.ratio}>"
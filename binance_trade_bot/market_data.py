@@ -0,0 +1,50 @@
+import threading
+import time
+from typing import Dict
+
+from binance.client import Client
+
+from .market import MarketPrices, SymbolTable
+from .order_book import OrderBookCache
+
+
+class MarketDataCache:
+    """
+    Public market data shared by every bot running in the same process. Tickers are fetched at most once per `ttl`
+    seconds and parsed once no matter how many bots ask for them, and exchange info is only ever fetched once per
+    symbol.
+    """
+
+    def __init__(self, tld="com", ttl=1.0):
+        self.binance_client = Client(tld=tld)
+        self.ttl = ttl
+        self.order_books = OrderBookCache(self.binance_client)
+        self.symbol_info: Dict[str, dict] = {}
+        self.symbols = SymbolTable()
+        self._tickers = None
+        self._prices = None
+        self._stale = False
+        self._tickers_timestamp = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        if self._tickers is None or time.time() - self._tickers_timestamp > self.ttl:
+            self._tickers = self.binance_client.get_all_tickers()
+            self._tickers_timestamp = time.time()
+            self._stale = True
+
+    def get_all_tickers(self):
+        with self._lock:
+            self._refresh()
+            return self._tickers
+
+    def get_prices(self) -> MarketPrices:
+        with self._lock:
+            self._refresh()
+            # The symbol table is shared by every snapshot, so it is only ever extended while holding the lock
+            if self._stale:
+                self._prices = MarketPrices.from_tickers(
+                    self._tickers, self.symbols, self._tickers_timestamp, self._prices
+                )
+                self._stale = False
+            return self._prices
@@ -0,0 +1,101 @@
+from datetime import datetime as _datetime
+
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer, String
+
+from .base import Base
+from .trade import Trade
+
+
+class CoinStats(Base):
+    """
+    Running totals of the trades of one coin, amounts are in the bridge currency
+    """
+
+    __tablename__ = "coin_stats"
+
+    coin_id = Column(String, ForeignKey("coins.symbol"), primary_key=True)
+
+    jumps = Column(Integer)
+    sells = Column(Integer)
+    realized_pnl = Column(Float)
+    fees_paid = Column(Float)
+    hold_seconds = Column(Float)
+
+    # Cost and time of the buy of the current holding, if it was bought while stats were kept
+    cost_basis = Column(Float)
+    bought_at = Column(DateTime)
+
+    def __init__(self, coin_id: str):
+        self.coin_id = coin_id
+        self.jumps = 0
+        self.sells = 0
+        self.realized_pnl = 0.0
+        self.fees_paid = 0.0
+        self.hold_seconds = 0.0
+
+    def record_trade(self, trade: Trade, fee_rate: float):
+        amount = float(trade.crypto_trade_amount)
+        self.fees_paid += amount * fee_rate
+        if not trade.selling:
+            self.jumps += 1
+            self.cost_basis = amount
+            self.bought_at = trade.datetime
+            return
+
+        self.sells += 1
+        if self.cost_basis is not None:
+            self.realized_pnl += amount - self.cost_basis
+            self.hold_seconds += (trade.datetime - self.bought_at).total_seconds()
+        self.cost_basis = None
+        self.bought_at = None
+
+    def info(self):
+        return {
+            "coin": self.coin_id,
+            "jumps": self.jumps,
+            "realized_pnl": self.realized_pnl,
+            "fees_paid": self.fees_paid,
+            "average_hold_seconds": self.hold_seconds / self.sells if self.sells else None,
+            "held_since": self.bought_at.isoformat() if self.bought_at else None,
+        }
+
+
+class PortfolioStats(Base):
+    """
+    Running peak and drawdown of the total USD value of the account. There is a single row.
+    """
+
+    __tablename__ = "portfolio_stats"
+
+    id = Column(Integer, primary_key=True)
+
+    usd_value = Column(Float)
+    peak_usd_value = Column(Float)
+    max_drawdown = Column(Float)
+    datetime = Column(DateTime)
+
+    def __init__(self):
+        self.id = 1
+        self.peak_usd_value = 0.0
+        self.max_drawdown = 0.0
+
+    def record_value(self, usd_value: float, at: _datetime):
+        self.usd_value = usd_value
+        self.datetime = at
+        self.peak_usd_value = max(self.peak_usd_value, usd_value)
+        self.max_drawdown = max(self.max_drawdown, self.drawdown)
+
+    @property
+    def drawdown(self):
+        if not self.peak_usd_value or self.usd_value is None:
+            return 0.0
+        return 1 - self.usd_value / self.peak_usd_value
+
+    def info(self):
+        return {
+            "usd_value": self.usd_value,
+            "peak_usd_value": self.peak_usd_value,
+            "drawdown": self.drawdown,
+            "max_drawdown": self.max_drawdown,
+            "datetime": self.datetime.isoformat() if self.datetime else None,
+        }
@@ -12,6 +12,8 @@ class TradeState(enum.Enum):
     STARTING = "STARTING"
     ORDERED = "ORDERED"
     COMPLETE = "COMPLETE"
+    # The order was cancelled, expired or rejected before it filled completely
+    FAILED = "FAILED"
 
 
 class Trade(Base):  # pylint: disable=too-few-public-methods
@@ -0,0 +1,68 @@
+import argparse
+import glob
+import os
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from .config import Config, request_reload
+from .crypto_trading import run_bot, setup_bot
+from .logger import Logger
+from .market_data import MarketDataCache
+
+PROFILES_GLOB = "profiles/*.cfg"
+
+
+def load_profiles(paths: List[str]) -> Dict[str, Config]:
+    profiles = {os.path.splitext(os.path.basename(path))[0]: Config(path, use_environment=False) for path in paths}
+
+    databases = [config.DATABASE_PATH for config in profiles.values()]
+    if len(set(databases)) != len(databases):
+        raise SystemExit("***\nERROR!\nEvery profile needs its own `database` setting\n***")
+    return profiles
+
+
+def run_profile(name: str, config: Config, market_data: MarketDataCache, stop: threading.Event):
+    logger = Logger(
+        f"crypto_trading_{name}",
+        json_lines=config.LOG_JSON,
+        max_bytes=config.LOG_MAX_BYTES,
+        backup_count=config.LOG_BACKUP_COUNT,
+    )
+    try:
+        logger.info(f"Starting profile {name}")
+        schedule, save_state = setup_bot(logger, config, market_data, f"data/{name}_state_snapshot.json")
+    except Exception as e:  # pylint: disable=broad-except
+        logger.error(f"Profile {name} failed to start: {e}")
+        return
+    try:
+        run_bot(schedule, stop)
+    finally:
+        save_state()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several bot profiles in one process")
+    parser.add_argument("profiles", nargs="*", help=f"profile configuration files (default: {PROFILES_GLOB})")
+    args = parser.parse_args()
+
+    profiles = load_profiles(args.profiles or sorted(glob.glob(PROFILES_GLOB)))
+    if not profiles:
+        raise SystemExit(f"No profiles found in {PROFILES_GLOB}")
+
+    # One market data cache per exchange, shared by all the profiles trading on it
+    market_data = {tld: MarketDataCache(tld) for tld in {config.BINANCE_TLD for config in profiles.values()}}
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGHUP, lambda signum, frame: request_reload())
+
+    with ThreadPoolExecutor(max_workers=len(profiles), thread_name_prefix="profile") as pool:
+        for name, config in profiles.items():
+            pool.submit(run_profile, name, config, market_data[config.BINANCE_TLD], stop)
+
+
+if __name__ == "__main__":
+    main()
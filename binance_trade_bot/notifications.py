@@ -1,20 +1,43 @@
 import queue
 import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 from os import path
 
-import apprise
-
 APPRISE_CONFIG_PATH = "config/apprise.yml"
 
+# Maximum number of notifications waiting to be sent, anything past it is dropped
+QUEUE_SIZE = 1000
+# Notifications arriving within this many seconds of each other are merged into a single digest, unless one of them
+# is urgent, e.g. a trade or an error
+DIGEST_WINDOW = 5
+
 
 class NotificationHandler:
-    def __init__(self):
+    def __init__(self, queue_size=QUEUE_SIZE, digest_window=DIGEST_WINDOW):
         if path.exists(APPRISE_CONFIG_PATH):
+            # apprise is slow to import, only load it when notifications are configured
+            import apprise  # pylint: disable=import-outside-toplevel
+
             self.apobj = apprise.Apprise()
             config = apprise.AppriseConfig()
             config.add(APPRISE_CONFIG_PATH)
             self.apobj.add(config)
-            self.queue = queue.Queue()
+            # One Apprise object per target, so a slow service doesn't hold back the others
+            self.targets = []
+            for server in self.apobj:
+                target = apprise.Apprise()
+                target.add(server)
+                self.targets.append(target)
+            self.pool = ThreadPoolExecutor(max_workers=max(len(self.targets), 1))
+            self.digest_window = digest_window
+            self.queue = queue.Queue(maxsize=queue_size)
+            self.dropped = 0
+            self.merged = 0
+            self._reported_dropped = 0
+            # Notifications are sent from every thread that logs
+            self._lock = threading.Lock()
             self.start_worker()
             self.enabled = True
         else:
@@ -25,14 +48,60 @@ class NotificationHandler:
 
     def process_queue(self):
         while True:
-            message, attachments = self.queue.get()
+            batch = [self.queue.get()]
+            deadline = time.time() + self.digest_window
+            # An urgent notification goes out right away, along with the ones already waiting for the digest
+            while not batch[-1][2]:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self.send_digest(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+    def send_digest(self, batch):
+        """
+        Send a batch of notifications as a single message, with repeated messages only sent once
+        """
+        counts = OrderedDict()
+        attachments = []
+        for message, message_attachments, _ in batch:
+            message = str(message)
+            counts[message] = counts.get(message, 0) + 1
+            attachments.extend(message_attachments)
+
+        lines = [message if count == 1 else f"{message} (x{count})" for message, count in counts.items()]
+
+        notes = []
+        if len(batch) > 1:
+            self.merged += len(batch) - 1
+            notes.append(f"{len(batch)} notifications merged, {self.merged} so far")
+        with self._lock:
+            dropped = self.dropped - self._reported_dropped
+            self._reported_dropped = self.dropped
+        if dropped:
+            notes.append(f"{dropped} notifications were dropped")
+        if notes:
+            lines.append(f"({', '.join(notes)})")
 
-            if attachments:
-                self.apobj.notify(body=message, attach=attachments)
-            else:
-                self.apobj.notify(body=message)
-            self.queue.task_done()
+        body = "\n".join(lines)
+        futures = [
+            self.pool.submit(target.notify, body=body, attach=attachments)
+            if attachments
+            else self.pool.submit(target.notify, body=body)
+            for target in self.targets
+        ]
+        wait(futures)
 
-    def send_notification(self, message, attachments=None):
+    def send_notification(self, message, attachments=None, urgent=False):
         if self.enabled:
-            self.queue.put((message, attachments or []))
+            try:
+                self.queue.put_nowait((message, attachments or [], urgent))
+            except queue.Full:
+                with self._lock:
+                    self.dropped += 1
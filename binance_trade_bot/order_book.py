@@ -0,0 +1,79 @@
+import time
+from typing import Dict, List, Optional, Tuple
+
+from binance.client import Client
+
+# A price level as returned by the order book endpoint, converted to floats: (price, quantity)
+Level = Tuple[float, float]
+
+
+class OrderBook:  # pylint: disable=too-few-public-methods
+    def __init__(self, bids: List[Level], asks: List[Level]):
+        self.bids = bids
+        self.asks = asks
+        self.timestamp = time.time()
+
+
+class OrderBookCache:
+    """
+    Short lived cache of order book snapshots, so that the scout cycle and the order placement that follows it
+    share the same REST snapshot instead of hammering the depth endpoint.
+    """
+
+    def __init__(self, binance_client: Client, limit=100, ttl=1.0):
+        self.binance_client = binance_client
+        self.limit = limit
+        self.ttl = ttl
+        self.books: Dict[str, OrderBook] = {}
+
+    def get(self, symbol: str, max_age: float = None) -> OrderBook:
+        max_age = self.ttl if max_age is None else max_age
+        book = self.books.get(symbol)
+        if book is None or time.time() - book.timestamp > max_age:
+            depth = self.binance_client.get_order_book(symbol=symbol, limit=self.limit)
+            book = OrderBook(
+                [(float(price), float(qty)) for price, qty in depth["bids"]],
+                [(float(price), float(qty)) for price, qty in depth["asks"]],
+            )
+            self.books[symbol] = book
+        return book
+
+    def refresh(self, symbols: List[str]):
+        """
+        Fetch a fresh snapshot for every given symbol
+        """
+        for symbol in symbols:
+            self.get(symbol, max_age=0)
+
+
+def estimate_fill(levels: List[Level], quantity: float = None, quote_quantity: float = None):
+    """
+    Walk the given side of the book and return (volume weighted fill price, worst level price) for an order of
+    `quantity` base units or `quote_quantity` quote units. Returns None when the book is not deep enough.
+    """
+    if not levels:
+        return None
+    if not quantity and not quote_quantity:
+        return levels[0][0], levels[0][0]
+
+    remaining = total = quantity if quantity is not None else quote_quantity
+    filled = 0.0
+    cost = 0.0
+    for price, qty in levels:
+        take = min(qty, remaining if quantity is not None else remaining / price)
+        filled += take
+        cost += take * price
+        remaining -= take if quantity is not None else take * price
+        if remaining <= total * 1e-9:
+            return cost / filled, price
+    return None
+
+
+def estimate_fill_price(book: OrderBook, buying: bool, quantity: float = None, quote_quantity: float = None):
+    """
+    Volume weighted price we would pay (buying) or receive (selling) for the given order size
+    """
+    fill: Optional[Tuple[float, float]] = estimate_fill(
+        book.asks if buying else book.bids, quantity=quantity, quote_quantity=quote_quantity
+    )
+    return fill[0] if fill else None
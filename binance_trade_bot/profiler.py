@@ -0,0 +1,103 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Dict
+
+from .logger import Logger
+
+PROFILE_PATH = "logs"
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread of the running bot for a while, without tracing every call like cProfile.
+    Each stack is tagged with the scheduler job its thread was running, and the samples are written in the folded
+    format of flamegraph.pl and speedscope, one `frame;frame;frame count` line per distinct stack.
+    """
+
+    # Seconds between two samples
+    SAMPLE_INTERVAL = 0.01
+    # Seconds between two logs of the top stacks while profiling
+    REPORT_INTERVAL = 10
+    # Number of stacks logged per job
+    TOP_STACKS = 3
+
+    def __init__(self, logger: Logger, running_jobs: Dict[int, str] = None, path=PROFILE_PATH):
+        self.logger = logger
+        # Name of the job each thread is running, by thread id, as kept up to date by SafeScheduler
+        self.running_jobs = {} if running_jobs is None else running_jobs
+        self.path = path
+        self._thread = None
+
+    def start(self, duration: float):
+        """
+        Profile for `duration` seconds in the background, unless a profile is already running
+        """
+        if self._thread is not None and self._thread.is_alive():
+            self.logger.info("Already profiling", False)
+            return
+        self._thread = threading.Thread(target=self._run, args=(duration,), name="profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self, duration: float):
+        self.logger.info(f"Profiling for {duration:g}s", False)
+        samples: Counter = Counter()
+        jobs: Counter = Counter()
+        started = datetime.now()
+        now = time.monotonic()
+        end, next_sample, next_report = now + duration, now, now + self.REPORT_INTERVAL
+        rounds = 0
+        while next_sample < end:
+            self._sample(samples, jobs)
+            rounds += 1
+            now = time.monotonic()
+            if now >= next_report:
+                self.report(samples, jobs, rounds)
+                next_report += self.REPORT_INTERVAL
+            # Keep the sampling rate when a round takes a while, rather than sleeping a whole interval after it
+            next_sample = max(next_sample + self.SAMPLE_INTERVAL, now)
+            time.sleep(max(next_sample - time.monotonic(), 0))
+
+        path = os.path.join(self.path, f"profile-{started:%Y%m%d-%H%M%S}.folded")
+        os.makedirs(self.path, exist_ok=True)
+        with open(path, "w") as f:
+            for (tag, stack), count in samples.most_common():
+                f.write(f"{';'.join((tag,) + stack)} {count}\n")
+        self.report(samples, jobs, rounds)
+        self.logger.info(f"Wrote {rounds} rounds of samples of {len(samples)} distinct stacks to {path}", False)
+
+    def _sample(self, samples: Counter, jobs: Counter):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        running = dict(self.running_jobs)
+        for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            job = running.get(ident)
+            if job is not None:
+                jobs[job] += 1
+            # Threads outside of a job are tagged with their name, e.g. the main loop waiting for the next job
+            tag = job or names.get(ident, str(ident))
+            samples[(tag, tuple(reversed(stack)))] += 1
+
+    def report(self, samples: Counter, jobs: Counter, rounds: int):
+        """
+        Log how much of the time each job was running and its most sampled stacks, showing their innermost frames
+        """
+        for job, job_total in jobs.most_common():
+            stacks = Counter({stack: count for (tag, stack), count in samples.items() if tag == job})
+            top = (
+                f"{count / job_total:.0%} {' <- '.join(reversed(stack[-3:]))}"
+                for stack, count in stacks.most_common(self.TOP_STACKS)
+            )
+            self.logger.info(
+                f"{job}: running {job_total / rounds:.0%} of the time, top stacks: {' | '.join(top)}", False
+            )
@@ -0,0 +1,127 @@
+import atexit
+import gzip
+import json
+import os
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+TICKER_RECORDING_PATH = "data/recordings"
+
+# Number of snapshots per file. Every file starts with absolute prices, so each one can be read on its own.
+CHUNK_SNAPSHOTS = 1000
+
+# Prices are stored as integers of this many units, Binance quotes them with at most 8 decimals
+PRICE_SCALE = 10 ** 8
+
+
+class TickerRecorder:
+    """
+    Appends the ticker snapshots the bot sees to gzipped JSON lines files. Every line holds the timestamp and, for
+    each symbol whose price changed since the previous line, the change in integer price units.
+    """
+
+    def __init__(self, path=TICKER_RECORDING_PATH, chunk_snapshots=CHUNK_SNAPSHOTS):
+        self.path = path
+        self.chunk_snapshots = chunk_snapshots
+        self._file: Optional[gzip.GzipFile] = None
+        self._snapshots = 0
+        self._last: Dict[str, int] = {}
+        # The end of the gzip stream is only written on close
+        atexit.register(self.close)
+
+    def record(self, all_tickers: List[dict], timestamp: float = None):
+        if timestamp is None:
+            timestamp = time.time()
+        if self._file is None or self._snapshots >= self.chunk_snapshots:
+            self._start_chunk(timestamp)
+
+        prices = {ticker["symbol"]: round(float(ticker["price"]) * PRICE_SCALE) for ticker in all_tickers}
+        deltas = {symbol: price - self._last.get(symbol, 0) for symbol, price in prices.items()}
+        changes = {symbol: delta for symbol, delta in deltas.items() if delta or symbol not in self._last}
+        # Delisted symbols are marked with null, so they aren't replayed at their last price forever
+        changes.update({symbol: None for symbol in self._last.keys() - prices.keys()})
+
+        self._file.write(json.dumps({"t": timestamp, "p": changes}, separators=(",", ":")).encode() + b"\n")
+        self._last = prices
+        self._snapshots += 1
+
+    def _start_chunk(self, timestamp: float):
+        self.close()
+        os.makedirs(self.path, exist_ok=True)
+        self._file = gzip.open(os.path.join(self.path, f"tickers-{timestamp:.3f}.jsonl.gz"), "wb")
+        self._snapshots = 0
+        self._last = {}
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def read_recording(path=TICKER_RECORDING_PATH) -> Iterator[Tuple[float, List[dict]]]:
+    """
+    Yield the recorded (timestamp, tickers) snapshots in order, the tickers in the format of the Binance API
+    """
+    if not os.path.isdir(path):
+        return
+    # The names hold the timestamp of the first snapshot, with a fixed number of decimals
+    chunks = sorted(
+        (name for name in os.listdir(path) if name.startswith("tickers-") and name.endswith(".jsonl.gz")),
+        key=lambda name: float(name[len("tickers-") : -len(".jsonl.gz")]),
+    )
+    for name in chunks:
+        prices: Dict[str, int] = {}
+        with gzip.open(os.path.join(path, name), "rb") as f:
+            try:
+                for line in f:
+                    snapshot = json.loads(line)
+                    for symbol, delta in snapshot["p"].items():
+                        if delta is None:
+                            del prices[symbol]
+                        else:
+                            prices[symbol] = prices.get(symbol, 0) + delta
+                    yield snapshot["t"], [
+                        {"symbol": symbol, "price": f"{price / PRICE_SCALE:.8f}"} for symbol, price in prices.items()
+                    ]
+            except (EOFError, zlib.error, ValueError):
+                # The last chunk of a recording that was interrupted ends with a truncated line or gzip stream
+                continue
+
+
+class ReplayClient:
+    """
+    Serves a recording through the ticker methods of the Binance client. With a `speed`, the recording plays along
+    the wall clock that many times faster than it was recorded. Without one, every call returns the next snapshot.
+    """
+
+    def __init__(self, path=TICKER_RECORDING_PATH, speed: float = None):
+        self.speed = speed
+        self._snapshots = read_recording(path)
+        self._current: Optional[Tuple[float, List[dict]]] = None
+        self._next = next(self._snapshots, None)
+        self._started_at = None
+        self._start_timestamp = None
+
+    def _advance(self):
+        self._current, self._next = self._next, next(self._snapshots, None)
+
+    def get_all_tickers(self):
+        if self.speed is None:
+            if self._next is not None:
+                self._advance()
+        else:
+            if self._started_at is None:
+                self._started_at = time.time()
+                self._start_timestamp = self._next[0] if self._next is not None else 0.0
+            now = self._start_timestamp + (time.time() - self._started_at) * self.speed
+            while self._next is not None and (self._current is None or self._next[0] <= now):
+                self._advance()
+        return self._current[1] if self._current else []
+
+    def get_symbol_ticker(self):
+        return self.get_all_tickers()
+
+    @property
+    def finished(self):
+        return self._next is None
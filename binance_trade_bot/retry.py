@@ -0,0 +1,248 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+from copy import copy
+from typing import Callable, Dict, Iterable
+
+from binance.exceptions import BinanceAPIException, BinanceRequestException
+from requests.exceptions import ConnectionError as RequestsConnectionError
+from requests.exceptions import Timeout
+
+from .logger import Logger
+
+# Binance error codes of an overloaded or unreachable backend, the same request may well succeed later
+TRANSIENT_CODES = {-1000, -1001, -1006, -1007, -1008}
+# Binance error codes of a request weight or order rate limit, or of a ban for ignoring them
+RATE_LIMITED_CODES = {-1003, -1015}
+RATE_LIMITED_STATUSES = {418, 429}
+
+# Errors below the Binance API, where the request may not have reached the exchange at all
+TRANSIENT_ERRORS = (RequestsConnectionError, Timeout, BinanceRequestException)
+
+
+def is_rate_limited(e: Exception):
+    return isinstance(e, BinanceAPIException) and (
+        e.status_code in RATE_LIMITED_STATUSES or e.code in RATE_LIMITED_CODES
+    )
+
+
+def is_transient(e: Exception):
+    """
+    Whether the error says something about the state of the exchange rather than about the request
+    """
+    if isinstance(e, BinanceAPIException):
+        return e.status_code >= 500 or e.code in TRANSIENT_CODES or is_rate_limited(e)
+    return isinstance(e, TRANSIENT_ERRORS)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class RetryPolicy:  # pylint: disable=too-few-public-methods
+    """
+    How often and how patiently to retry a call. Transient errors are always retried, `retry_codes` adds Binance
+    error codes that are worth retrying for this call only, and `retry_all` retries any exception. Calls made of
+    other calls, whose failures were already counted by the circuit breaker, don't `trip_breaker`.
+    """
+
+    def __init__(
+        self,
+        attempts=5,
+        base_delay=0.5,
+        max_delay=10.0,
+        retry_codes: Iterable[int] = (),
+        retry_all=False,
+        trip_breaker=True,
+    ):  # pylint: disable=too-many-arguments
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_codes = set(retry_codes)
+        self.retry_all = retry_all
+        self.trip_breaker = trip_breaker
+
+    def is_retryable(self, e: Exception):
+        if self.retry_all or is_transient(e):
+            return True
+        return isinstance(e, BinanceAPIException) and e.code in self.retry_codes
+
+    def delay(self, attempt: int):
+        """
+        Exponential backoff with full jitter, so that retries of several bots don't hit the exchange in lockstep
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+DEFAULT_POLICY = RetryPolicy()
+
+# Policies of the calls that need another one than the default, by name of the Binance client method
+ENDPOINT_POLICIES: Dict[str, RetryPolicy] = {
+    # Binance server can take some time to save a new order, until then it doesn't know about it
+    "get_order": RetryPolicy(attempts=10, base_delay=0.2, max_delay=5.0, retry_codes={-2013}),
+    # Placing an order isn't idempotent, a request that failed may still have placed it. BinanceAPIManager looks the
+    # order up instead, and leaves retrying to the buy or sell.
+    "order_limit_buy": RetryPolicy(attempts=1),
+    "order_market_sell": RetryPolicy(attempts=1),
+    # Buying and selling start over with fresh balances and prices on any error, e.g. an order rejected for a
+    # balance that the account didn't show yet
+    "buy_alt": RetryPolicy(attempts=8, base_delay=1.0, max_delay=30.0, retry_all=True, trip_breaker=False),
+    "sell_alt": RetryPolicy(attempts=8, base_delay=1.0, max_delay=30.0, retry_all=True, trip_breaker=False),
+}
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` transient errors in a row, or right away on a rate limit, and stays open for
+    `reset_timeout` seconds. The first call after that is a trial: the breaker closes if it succeeds and opens again
+    if it fails.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=60.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.trips = 0
+        self.opened_at = None
+
+    def is_open(self):
+        return self.opened_at is not None and self.clock() - self.opened_at < self.reset_timeout
+
+    def remaining(self):
+        return max(self.reset_timeout - (self.clock() - self.opened_at), 0.0) if self.opened_at is not None else 0.0
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self, rate_limited=False):
+        """
+        Returns whether this failure opened the breaker
+        """
+        self.failures += 1
+        if self.is_open() or (self.failures < self.failure_threshold and not rate_limited):
+            return False
+        self.opened_at = self.clock()
+        self.trips += 1
+        return True
+
+
+class EndpointStats:  # pylint: disable=too-few-public-methods
+    __slots__ = ("calls", "attempts", "failures", "gave_up", "short_circuited", "total_latency", "max_latency")
+
+    def __init__(self):
+        self.calls = 0
+        self.attempts = 0
+        self.failures = 0
+        self.gave_up = 0
+        self.short_circuited = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record_attempt(self, latency: float, failed: bool):
+        self.attempts += 1
+        self.failures += failed
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+
+class Retrier:
+    """
+    Makes calls to the exchange with the retry policy of their endpoint, behind a circuit breaker shared by all of
+    them. While the breaker is open, calls fail right away with CircuitOpenError, unless they are made in a
+    `critical()` block, e.g. to finish a trade, in which case they wait for it to close.
+    """
+
+    def __init__(self, logger: Logger, breaker: CircuitBreaker = None, policies: Dict[str, RetryPolicy] = None):
+        self.logger = logger
+        self.breaker = breaker or CircuitBreaker()
+        self.policies = ENDPOINT_POLICIES if policies is None else policies
+        self.stats: Dict[str, EndpointStats] = {}
+        self._local = threading.local()
+        # Calls are made from the trading loop and the thread preparing a buy, while reports run in the background
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def critical(self):
+        previous = getattr(self._local, "critical", False)
+        self._local.critical = True
+        try:
+            yield
+        finally:
+            self._local.critical = previous
+
+    def call(self, endpoint: str, func: Callable, *args, **kwargs):
+        policy = self.policies.get(endpoint, DEFAULT_POLICY)
+        with self._lock:
+            stats = self.stats.setdefault(endpoint, EndpointStats())
+            stats.calls += 1
+        critical = getattr(self._local, "critical", False)
+        attempt = 0
+        while True:
+            if self.breaker.is_open():
+                if not critical:
+                    with self._lock:
+                        stats.short_circuited += 1
+                    raise CircuitOpenError(f"Not calling {endpoint}, the exchange is failing")
+                time.sleep(self.breaker.remaining())
+
+            attempt += 1
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except CircuitOpenError:
+                raise
+            except Exception as e:  # pylint: disable=broad-except
+                with self._lock:
+                    stats.record_attempt(time.perf_counter() - start, True)
+                    if policy.trip_breaker:
+                        self._record_failure(endpoint, e)
+                if (
+                    not policy.is_retryable(e)
+                    or attempt >= policy.attempts
+                    or (self.breaker.is_open() and not critical)
+                ):
+                    with self._lock:
+                        stats.gave_up += 1
+                    raise
+                if self.breaker.is_open():
+                    # Waiting for the breaker to close is backoff enough
+                    continue
+                delay = policy.delay(attempt)
+                self.logger.info(f"{endpoint} failed ({e}), attempt {attempt}/{policy.attempts}, retry in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            with self._lock:
+                stats.record_attempt(time.perf_counter() - start, False)
+                if policy.trip_breaker:
+                    self.breaker.record_success()
+            return result
+
+    def _record_failure(self, endpoint: str, e: Exception):
+        if not is_transient(e):
+            # The exchange answered, it just didn't like the request
+            self.breaker.record_success()
+        elif self.breaker.record_failure(is_rate_limited(e)):
+            self.logger.warning(
+                f"{endpoint} failed ({e}), pausing calls to the exchange for {self.breaker.reset_timeout:g}s"
+            )
+
+    def report(self):
+        """
+        Log the attempt, failure and latency stats of every endpoint
+        """
+        with self._lock:
+            all_stats = [(endpoint, copy(stats)) for endpoint, stats in sorted(self.stats.items())]
+            trips = self.breaker.trips
+        for endpoint, stats in all_stats:
+            mean_latency = stats.total_latency / stats.attempts if stats.attempts else 0
+            self.logger.info(
+                f"{endpoint}: {stats.calls} calls, {stats.attempts} attempts, {stats.failures} failed, "
+                f"{stats.gave_up} gave up, {stats.short_circuited} short-circuited, "
+                f"latency {mean_latency * 1000:.0f}ms mean / {stats.max_latency * 1000:.0f}ms max",
+                False,
+            )
+        self.logger.info(f"Circuit breaker tripped {trips} times", False)
@@ -1,10 +1,84 @@
 import datetime
 import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from traceback import format_exc
 
 from schedule import Job, Scheduler
 
 
+class SafeJob(Job):
+    """
+    A Job that keeps a fixed rate, skips the runs it missed instead of running them late, and records its timing.
+    """
+
+    def __init__(self, interval, scheduler=None):
+        super().__init__(interval, scheduler)
+        self.background = False
+        self.running = False
+        self.paused = None
+        self.runs = 0
+        self.skipped = 0
+        self.paused_runs = 0
+        self.overruns = 0
+        self.total_lag = 0.0
+        self.max_lag = 0.0
+        self.max_duration = 0.0
+        self.first_run = None
+
+    def in_background(self):
+        """
+        Run this job on the scheduler's worker pool, so it never delays the jobs running in the main loop
+        """
+        self.background = True
+        return self
+
+    def paused_while(self, condition):
+        """
+        Skip the runs that are due while `condition()` is true
+        """
+        self.paused = condition
+        return self
+
+    def set_interval(self, interval: float):
+        """
+        Change the interval of the job, taking effect when its next run gets scheduled
+        """
+        self.interval = interval
+
+    def _schedule_next_run(self):
+        previous_run = self.next_run
+        super()._schedule_next_run()
+        if previous_run is None or self.at_time is not None or self.latest is not None:
+            return
+
+        # Schedule from the previous due time rather than from now, so the run time doesn't add up as drift, and
+        # skip whatever runs we missed
+        next_run = previous_run + self.period
+        now = datetime.datetime.now()
+        if next_run <= now:
+            missed = math.floor((now - next_run) / self.period) + 1
+            self.skipped += missed
+            next_run += self.period * missed
+        self.next_run = next_run
+
+    def record(self, lag: float, duration: float):
+        if self.first_run is None:
+            self.first_run = time.time()
+        self.runs += 1
+        self.total_lag += lag
+        self.max_lag = max(self.max_lag, lag)
+        self.max_duration = max(self.max_duration, duration)
+        if self.period is not None and duration > self.period.total_seconds():
+            self.overruns += 1
+
+    @property
+    def name(self):
+        return next(iter(self.tags)) if self.tags else repr(self.job_func)
+
+
 class SafeScheduler(Scheduler):
     """
     An implementation of Scheduler that catches jobs that fail, logs their
@@ -12,22 +86,90 @@ class SafeScheduler(Scheduler):
 
     Use this to run jobs that may or may not crash without worrying about
     whether other jobs will run or if they'll crash the entire script.
+
+    Jobs marked with `in_background()` run on a worker pool, while the others
+    keep the main loop to themselves and run first when several are due.
     """
 
-    def __init__(self, logger: logging.Logger, rerun_immediately=True):
+    def __init__(self, logger: logging.Logger, rerun_immediately=True, max_workers=2):
         self.logger = logger
         self.rerun_immediately = rerun_immediately
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scheduler")
+        # Name of the job each thread is running, by thread id, for the profiler
+        self.running_jobs = {}
 
         super().__init__()
 
-    def _run_job(self, job: Job):
+    def every(self, interval=1):
+        return SafeJob(interval, self)
+
+    def run_pending(self):
+        runnable_jobs = sorted(job for job in self.jobs if job.should_run)
+        # Foreground jobs first, the sort is stable so each group keeps its due order
+        for job in sorted(runnable_jobs, key=lambda job: job.background):
+            if job.paused is not None and job.paused():
+                job.paused_runs += 1
+                job.last_run = datetime.datetime.now()
+                job._schedule_next_run()  # pylint: disable=protected-access
+            elif job.background:
+                self._submit_job(job)
+            else:
+                self._run_job(job)
+
+    def _run_job(self, job: SafeJob):
+        lag = (datetime.datetime.now() - job.next_run).total_seconds()
+        start = time.time()
+        self.running_jobs[threading.get_ident()] = job.name
         try:
             super()._run_job(job)
         except Exception:  # pylint: disable=broad-except
-            self.logger.error(f"Error while {next(iter(job.tags))}...\n{format_exc()}")
+            self.logger.error(f"Error while {job.name}...\n{format_exc()}")
             job.last_run = datetime.datetime.now()
             if not self.rerun_immediately:
                 # Reschedule the job for the next time it was meant to run, instead of
                 # letting it run
                 # next tick
                 job._schedule_next_run()  # pylint: disable=protected-access
+        finally:
+            self.running_jobs.pop(threading.get_ident(), None)
+        job.record(lag, time.time() - start)
+
+    def _submit_job(self, job: SafeJob):
+        lag = (datetime.datetime.now() - job.next_run).total_seconds()
+        job.last_run = datetime.datetime.now()
+        job._schedule_next_run()  # pylint: disable=protected-access
+
+        if job.running:
+            # The previous run is still going, don't stack another one behind it
+            job.skipped += 1
+            return
+
+        job.running = True
+        self.pool.submit(self._run_in_background, job, lag)
+
+    def _run_in_background(self, job: SafeJob, lag: float):
+        start = time.time()
+        self.running_jobs[threading.get_ident()] = job.name
+        try:
+            job.job_func()
+        except Exception:  # pylint: disable=broad-except
+            self.logger.error(f"Error while {job.name}...\n{format_exc()}")
+        finally:
+            job.running = False
+            self.running_jobs.pop(threading.get_ident(), None)
+        job.record(lag, time.time() - start)
+
+    def report(self):
+        """
+        Log the lag, duration, overrun and skip stats of every job
+        """
+        for job in self.jobs:
+            mean_lag = job.total_lag / job.runs if job.runs else 0
+            rate = (job.runs - 1) / (time.time() - job.first_run) if job.runs > 1 else 0
+            self.logger.info(
+                f"{job.name}: {job.runs} runs ({rate:.2f}/s, every {job.interval:g} {job.unit} now), "
+                f"lag {mean_lag * 1000:.0f}ms mean / {job.max_lag * 1000:.0f}ms max, "
+                f"longest run {job.max_duration:.2f}s, {job.overruns} overruns, {job.skipped} skipped, "
+                f"{job.paused_runs} paused",
+                False,
+            )
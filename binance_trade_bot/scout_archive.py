@@ -0,0 +1,108 @@
+import mmap
+import os
+from array import array
+from datetime import date, datetime
+from itertools import groupby
+from typing import Dict, Iterable, List, Tuple
+
+# Column name and array typecode, in the order rows are given to ScoutHistoryArchive.append
+COLUMNS = (
+    ("datetime", "d"),
+    ("pair_id", "i"),
+    ("target_ratio", "d"),
+    ("current_coin_price", "d"),
+    ("other_coin_price", "d"),
+)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class ArchivedScoutHistory:
+    """
+    One day of archived scout history. Every column is a memoryview over a memory mapped file, so nothing is read
+    from disk until it is accessed.
+    """
+
+    def __init__(self, day_path: str):
+        self._maps: List[mmap.mmap] = []
+        self.columns: Dict[str, memoryview] = {}
+        for name, typecode in COLUMNS:
+            self.columns[name] = self._map_column(os.path.join(day_path, f"{name}.bin"), typecode)
+
+        # A crash in the middle of an append can leave columns of different lengths, ignore the incomplete rows
+        self.length = min(len(column) for column in self.columns.values())
+        self.columns = {name: column[: self.length] for name, column in self.columns.items()}
+
+    def _map_column(self, path: str, typecode: str):
+        if not os.path.isfile(path) or os.path.getsize(path) == 0:
+            return memoryview(array(typecode))
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        size = array(typecode).itemsize
+        return memoryview(mapped)[: len(mapped) // size * size].cast(typecode)
+
+    def __getitem__(self, column: str) -> memoryview:
+        return self.columns[column]
+
+    def __len__(self):
+        return self.length
+
+    def close(self):
+        for column in self.columns.values():
+            column.release()
+        for mapped in self._maps:
+            mapped.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ScoutHistoryArchive:
+    """
+    Append-only columnar archive of scout history, one directory per day and one raw typed file per column.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def append(self, rows: Iterable[Tuple[datetime, str, float, float, float]]):
+        """
+        Append (datetime, pair_id, target_ratio, current_coin_price, other_coin_price) rows
+        """
+        for day, day_rows in groupby(sorted(rows, key=lambda row: row[0]), key=lambda row: row[0].date()):
+            day_rows = list(day_rows)
+            day_path = os.path.join(self.path, day.isoformat())
+            os.makedirs(day_path, exist_ok=True)
+            self._drop_incomplete_rows(day_path)
+
+            values = list(zip(*day_rows))
+            values[0] = [(dt - EPOCH).total_seconds() for dt in values[0]]
+            values[1] = [int(pair_id) for pair_id in values[1]]
+            for (name, typecode), column in zip(COLUMNS, values):
+                with open(os.path.join(day_path, f"{name}.bin"), "ab") as f:
+                    array(typecode, column).tofile(f)
+
+    @staticmethod
+    def _drop_incomplete_rows(day_path: str):
+        """
+        Cut every column to the rows all of them have, e.g. after a crash in the middle of an append, so that the
+        rows appended next line up
+        """
+        paths = [(os.path.join(day_path, f"{name}.bin"), array(typecode).itemsize) for name, typecode in COLUMNS]
+        sizes = [(path, itemsize, os.path.getsize(path) if os.path.isfile(path) else 0) for path, itemsize in paths]
+        length = min(size // itemsize for _, itemsize, size in sizes)
+        for path, itemsize, size in sizes:
+            if size != length * itemsize:
+                os.truncate(path, length * itemsize)
+
+    def days(self) -> List[date]:
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(date.fromisoformat(day) for day in os.listdir(self.path))
+
+    def read(self, day: date) -> ArchivedScoutHistory:
+        return ArchivedScoutHistory(os.path.join(self.path, day.isoformat()))
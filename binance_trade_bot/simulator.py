@@ -0,0 +1,417 @@
+"""
+In-process exchange with the interface of the python-binance Client, to run the bot without keys:
+
+    python -m binance_trade_bot.simulator --cycles 1000
+"""
+import argparse
+import math
+import random
+import time
+from typing import Dict, Optional, Sequence
+
+from binance.exceptions import BinanceAPIException
+
+# Request weight of each endpoint, as counted by Binance against the limit per minute
+REQUEST_WEIGHTS = {
+    "get_all_tickers": 2,
+    "get_symbol_ticker": 2,
+    "get_account": 10,
+    "get_symbol_info": 10,
+    "get_order_book": 1,
+    "get_klines": 1,
+    "order_limit_buy": 1,
+    "order_market_sell": 1,
+    "get_order": 2,
+    "cancel_order": 1,
+}
+
+
+class _Response:  # pylint: disable=too-few-public-methods
+    def __init__(self, status_code: int, code: int, message: str):
+        self.status_code = status_code
+        self.text = message
+        self._json = {"code": code, "msg": message}
+
+    def json(self):
+        return self._json
+
+
+def _error(code: int, message: str, status_code=400):
+    return BinanceAPIException(_Response(status_code, code, message))
+
+
+def _on_grid(value: float, size: float):
+    return abs(round(value / size) * size - value) <= size * 1e-6
+
+
+class SimulatedSymbol:  # pylint: disable=too-few-public-methods
+    __slots__ = ("symbol", "base", "quote", "price", "tick_size", "step_size")
+
+    def __init__(self, base: str, quote: str, price: float):
+        self.symbol = base + quote
+        self.base = base
+        self.quote = quote
+        # Binance-like filters: 5 significant digits of price, and lots worth about a cent
+        self.tick_size = 10 ** (math.floor(math.log10(price)) - 4)
+        self.step_size = 10 ** min(max(math.floor(math.log10(0.01 / price)), -8), 3)
+        self.price = self.round_price(price)
+
+    def round_price(self, price: float):
+        # Rounded again to the 8 decimals prices are quoted with, or the grid doesn't survive a round trip
+        return round(max(round(price / self.tick_size), 1) * self.tick_size, 8)
+
+    def book(self, spread: float, levels: int, level_value: float):
+        """
+        Synthetic (bids, asks) of `levels` levels each, `level_value` quote worth per level
+        """
+        quantity = level_value / self.price
+        bids = [(self.round_price(self.price * (1 - spread * i)), quantity) for i in range(1, levels + 1)]
+        asks = [(self.round_price(self.price * (1 + spread * i)), quantity) for i in range(1, levels + 1)]
+        return bids, asks
+
+
+class ExchangeSimulator:  # pylint: disable=too-many-instance-attributes
+    """
+    Deterministic stand-in for the python-binance Client. Prices follow a seeded random walk that takes a step on
+    every ticker fetch, and on every status check of an open order, as time passes while the bot waits for it.
+    Orders are matched against a synthetic order book around the price, so large orders walk the book and limit
+    orders can fill partially and rest. Fees are taken from the asset received, like Binance does without BNB.
+    """
+
+    def __init__(
+        self,
+        coins: Sequence[str],
+        bridge="USDT",
+        balances: Dict[str, float] = None,
+        seed=0,
+        volatility=0.002,
+        fee=0.001,
+        spread=0.0005,
+        levels=20,
+        level_value=1000.0,
+        latency=0.0,
+        weight_limit: Optional[int] = 1200,
+        clock=time.time,
+    ):
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.bridge = bridge
+        self.symbols: Dict[str, SimulatedSymbol] = {}
+        for coin in coins:
+            self.add_symbol(coin, bridge, math.exp(self.random.uniform(math.log(0.01), math.log(100))))
+        self.balances: Dict[str, float] = dict(balances or {bridge: 100.0})
+        self.locked: Dict[str, float] = {}
+        self.volatility = volatility
+        self.fee = fee
+        self.spread = spread
+        self.levels = levels
+        self.level_value = level_value
+        self.latency = latency
+        self.weight_limit = weight_limit
+        self.clock = clock
+        self.orders: Dict[int, dict] = {}
+        self.open_orders: Dict[int, dict] = {}
+        self.requests: Dict[str, int] = {}
+        self.weight_used = 0
+        self._weight_minute = None
+        self._next_order_id = 1
+
+    def add_symbol(self, base: str, quote: str, price: float):
+        symbol = SimulatedSymbol(base, quote, price)
+        self.symbols[symbol.symbol] = symbol
+
+    def _request(self, endpoint: str):
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.weight_limit is None:
+            return
+        minute = int(self.clock() // 60)
+        if minute != self._weight_minute:
+            self._weight_minute = minute
+            self.weight_used = 0
+        self.weight_used += REQUEST_WEIGHTS.get(endpoint, 1)
+        if self.weight_used > self.weight_limit:
+            message = f"Too much request weight used; current limit is {self.weight_limit} request weight per 1 MINUTE."
+            raise _error(-1003, message, 429)
+
+    def _symbol(self, symbol: str):
+        if symbol not in self.symbols:
+            raise _error(-1121, "Invalid symbol.")
+        return self.symbols[symbol]
+
+    def step(self):
+        """
+        Move every price one step of the random walk, and match the open orders against the new books
+        """
+        for symbol in self.symbols.values():
+            symbol.price = symbol.round_price(symbol.price * math.exp(self.random.gauss(0, self.volatility)))
+        for order in list(self.open_orders.values()):
+            self._match_buy(order)
+
+    def get_all_tickers(self):
+        self._request("get_all_tickers")
+        self.step()
+        return self._tickers()
+
+    def get_symbol_ticker(self, **params):
+        self._request("get_symbol_ticker")
+        if "symbol" in params:
+            symbol = self._symbol(params["symbol"])
+            return {"symbol": symbol.symbol, "price": f"{symbol.price:.8f}"}
+        return self._tickers()
+
+    def _tickers(self):
+        return [{"symbol": symbol.symbol, "price": f"{symbol.price:.8f}"} for symbol in self.symbols.values()]
+
+    def get_account(self):
+        self._request("get_account")
+        assets = set(self.balances) | set(self.locked)
+        return {
+            "balances": [
+                {
+                    "asset": asset,
+                    "free": f"{self.balances.get(asset, 0.0):.8f}",
+                    "locked": f"{self.locked.get(asset, 0.0):.8f}",
+                }
+                for asset in sorted(assets)
+            ]
+        }
+
+    def get_symbol_info(self, symbol: str):
+        self._request("get_symbol_info")
+        if symbol not in self.symbols:
+            return None
+        info = self.symbols[symbol]
+        return {
+            "symbol": symbol,
+            "status": "TRADING",
+            "baseAsset": info.base,
+            "quoteAsset": info.quote,
+            "filters": [
+                {
+                    "filterType": "PRICE_FILTER",
+                    "minPrice": f"{info.tick_size:.8f}",
+                    "maxPrice": "1000000.00000000",
+                    "tickSize": f"{info.tick_size:.8f}",
+                },
+                {
+                    "filterType": "LOT_SIZE",
+                    "minQty": f"{info.step_size:.8f}",
+                    "maxQty": "9000000.00000000",
+                    "stepSize": f"{info.step_size:.8f}",
+                },
+                {"filterType": "MIN_NOTIONAL", "minNotional": "10.00000000"},
+            ],
+        }
+
+    def get_order_book(self, symbol: str, limit=100):
+        self._request("get_order_book")
+        bids, asks = self._symbol(symbol).book(self.spread, min(self.levels, limit), self.level_value)
+        return {
+            "lastUpdateId": 0,
+            "bids": [[f"{price:.8f}", f"{quantity:.8f}"] for price, quantity in bids],
+            "asks": [[f"{price:.8f}", f"{quantity:.8f}"] for price, quantity in asks],
+        }
+
+    def get_klines(self, symbol: str, interval: str, limit=500, **params):  # pylint: disable=unused-argument
+        """
+        Minute klines of a random walk that ends at the current price, with only the open time and close price
+        filled in
+        """
+        self._request("get_klines")
+        price = self._symbol(symbol).price
+        last_open = int(self.clock() // 60) * 60000
+        # A generator of its own, so klines fetched from several threads don't depend on the order they're served in
+        generator = random.Random(f"{self.seed}:{symbol}:{last_open}")
+        closes = [price]
+        for _ in range(limit - 1):
+            closes.append(closes[-1] * math.exp(generator.gauss(0, self.volatility)))
+        return [
+            [last_open - 60000 * i, "0", "0", "0", f"{close:.8f}", "0"]
+            for i, close in reversed(list(enumerate(closes)))
+        ]
+
+    def _check_order(self, symbol: SimulatedSymbol, quantity: float, price: float):
+        if quantity <= 0 or not _on_grid(quantity, symbol.step_size):
+            raise _error(-1013, "Filter failure: LOT_SIZE")
+        if not _on_grid(price, symbol.tick_size):
+            raise _error(-1013, "Filter failure: PRICE_FILTER")
+        if quantity * price < 10:
+            raise _error(-1013, "Filter failure: MIN_NOTIONAL")
+
+    def _new_order(
+        self, symbol: SimulatedSymbol, side: str, order_type: str, quantity: float, price: float, client_order_id=None
+    ):  # pylint: disable=too-many-arguments
+        order = {
+            "symbol": symbol.symbol,
+            "orderId": self._next_order_id,
+            "clientOrderId": client_order_id or f"sim-{self._next_order_id}",
+            "price": f"{price:.8f}",
+            "origQty": f"{quantity:.8f}",
+            "executedQty": "0.00000000",
+            "cummulativeQuoteQty": "0.00000000",
+            "status": "NEW",
+            "type": order_type,
+            "side": side,
+        }
+        self._next_order_id += 1
+        self.orders[order["orderId"]] = order
+        return order
+
+    def _fill(self, order: dict, quantity: float, quote: float):
+        order["executedQty"] = f"{float(order['executedQty']) + quantity:.8f}"
+        order["cummulativeQuoteQty"] = f"{float(order['cummulativeQuoteQty']) + quote:.8f}"
+        filled = math.isclose(float(order["executedQty"]), float(order["origQty"]), rel_tol=1e-9)
+        order["status"] = "FILLED" if filled else "PARTIALLY_FILLED"
+
+    def order_limit_buy(self, symbol: str, quantity: float, price: float, newClientOrderId=None, **params):
+        # pylint: disable=invalid-name,unused-argument
+        self._request("order_limit_buy")
+        info = self._symbol(symbol)
+        quantity, price = float(quantity), float(price)
+        self._check_order(info, quantity, price)
+        cost = quantity * price
+        if self.balances.get(info.quote, 0.0) < cost - 1e-9:
+            raise _error(-2010, "Account has insufficient balance for requested action.")
+
+        # The whole cost is locked until the order is filled or cancelled
+        self.balances[info.quote] -= cost
+        self.locked[info.quote] = self.locked.get(info.quote, 0.0) + cost
+        order = self._new_order(info, "BUY", "LIMIT", quantity, price, newClientOrderId)
+        self.open_orders[order["orderId"]] = order
+        self._match_buy(order)
+        return dict(order)
+
+    def _match_buy(self, order: dict):
+        info = self.symbols[order["symbol"]]
+        limit = float(order["price"])
+        remaining = float(order["origQty"]) - float(order["executedQty"])
+        _, asks = info.book(self.spread, self.levels, self.level_value)
+        quantity = quote = 0.0
+        for price, available in asks:
+            if price > limit or remaining - quantity <= 0:
+                break
+            taken = min(available, remaining - quantity)
+            quantity += taken
+            quote += taken * price
+        # Quantities are kept to the 8 decimals of the order strings, so the locked balance adds up to zero
+        quantity = round(quantity, 8)
+        if quantity <= 0:
+            return
+
+        # Filled below the limit, the difference goes back to the free balance
+        self.locked[info.quote] -= quantity * limit
+        self.balances[info.quote] += quantity * limit - quote
+        self.balances[info.base] = self.balances.get(info.base, 0.0) + quantity * (1 - self.fee)
+        self._fill(order, quantity, quote)
+        if order["status"] == "FILLED":
+            del self.open_orders[order["orderId"]]
+
+    def order_market_sell(self, symbol: str, quantity: float, newClientOrderId=None, **params):
+        # pylint: disable=invalid-name,unused-argument
+        self._request("order_market_sell")
+        info = self._symbol(symbol)
+        quantity = float(quantity)
+        self._check_order(info, quantity, info.price)
+        if self.balances.get(info.base, 0.0) < quantity - 1e-9:
+            raise _error(-2010, "Account has insufficient balance for requested action.")
+
+        order = self._new_order(info, "SELL", "MARKET", quantity, 0.0, newClientOrderId)
+        bids, _ = info.book(self.spread, self.levels, self.level_value)
+        remaining = quantity
+        quote = 0.0
+        for i, (price, available) in enumerate(bids):
+            # A market order takes whatever the book has, the last level stands for everything below it
+            taken = remaining if i == len(bids) - 1 else min(available, remaining)
+            remaining -= taken
+            quote += taken * price
+            if remaining <= 0:
+                break
+
+        self.balances[info.base] -= quantity
+        self.balances[info.quote] = self.balances.get(info.quote, 0.0) + quote * (1 - self.fee)
+        self._fill(order, quantity, quote)
+        return dict(order)
+
+    def get_order(
+        self, symbol: str, orderId: int = None, origClientOrderId: str = None
+    ):  # pylint: disable=invalid-name
+        self._request("get_order")
+        if origClientOrderId is not None:
+            orderId = next(
+                (order["orderId"] for order in self.orders.values() if order["clientOrderId"] == origClientOrderId),
+                None,
+            )
+        order = self.orders.get(orderId)
+        if order is None or order["symbol"] != symbol:
+            raise _error(-2013, "Order does not exist.")
+        if orderId in self.open_orders:
+            self.step()
+        return dict(order)
+
+    def cancel_order(self, symbol: str, orderId: int):  # pylint: disable=invalid-name
+        self._request("cancel_order")
+        order = self.open_orders.pop(orderId, None)
+        if order is None or order["symbol"] != symbol:
+            raise _error(-2011, "Unknown order sent.")
+        info = self.symbols[symbol]
+        unfilled = (float(order["origQty"]) - float(order["executedQty"])) * float(order["price"])
+        self.locked[info.quote] -= unfilled
+        self.balances[info.quote] += unfilled
+        order["status"] = "CANCELED"
+        return dict(order)
+
+
+def main():
+    # pylint: disable=import-outside-toplevel
+    from .auto_trader import AutoTrader
+    from .binance_api_manager import BinanceAPIManager
+    from .config import Config
+    from .database import Database
+    from .logger import Logger
+
+    parser = argparse.ArgumentParser(description="Run the bot against the exchange simulator")
+    parser.add_argument("-n", "--cycles", type=int, default=1000, help="number of scouts to run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    args = parser.parse_args()
+
+    class SimulatedDatabase(Database):
+        # There is no API server to push updates to
+        def send_update(self, model):
+            pass
+
+        def send_updates(self, models: list):
+            pass
+
+    # The simulator needs neither API keys nor a starting coin
+    config = Config(defaults={"api_key": "", "api_secret_key": "", "current_coin": ""})
+    logger = Logger("simulator")
+    simulator = ExchangeSimulator(
+        config.SUPPORTED_COIN_LIST, config.BRIDGE_SYMBOL, seed=args.seed, latency=args.latency, weight_limit=None
+    )
+    db = SimulatedDatabase(logger, config, "sqlite://")
+    manager = BinanceAPIManager(config, db, logger, binance_client=simulator)
+    trader = AutoTrader(manager, db, logger, config)
+    db.create_database()
+    db.set_coins(config.SUPPORTED_COIN_LIST)
+    trader.initialize_trade_thresholds()
+    # Start from the bridge, the first coin is bought like when no current coin is configured
+    config.CURRENT_COIN_SYMBOL = ""
+    trader.initialize_current_coin()
+
+    start = time.perf_counter()
+    for _ in range(args.cycles):
+        trader.scout()
+    duration = time.perf_counter() - start
+
+    account = {asset: balance for asset, balance in simulator.balances.items() if balance > 0}
+    print()
+    print(f"{args.cycles} scouts in {duration:.2f}s ({args.cycles / duration:.0f}/s)")
+    print(f"{len(trader.executor.latencies)} jumps, final balances: {account}")
+    print(f"Requests: {simulator.requests}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Measure how long the bot and the API server take to import and initialize:
+
+    python -m binance_trade_bot.startup_benchmark
+"""
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from .config import CFG_FL_NAME
+
+IMPORTS = [
+    "sqlalchemy",
+    "binance.client",
+    "socketio",
+    "apprise",
+    "flask_socketio",
+    "binance_trade_bot.database",
+    "binance_trade_bot.crypto_trading",
+    "binance_trade_bot.api_server",
+]
+
+INIT_SCRIPT = """
+import os, time
+os.makedirs("logs", exist_ok=True)
+os.makedirs("data", exist_ok=True)
+timings = []
+start = time.perf_counter()
+from binance_trade_bot.config import Config
+from binance_trade_bot.database import Database
+from binance_trade_bot.logger import Logger
+timings.append(("imports", time.perf_counter() - start))
+start = time.perf_counter()
+config = Config()
+timings.append(("config", time.perf_counter() - start))
+start = time.perf_counter()
+logger = Logger("startup_benchmark")
+timings.append(("logger", time.perf_counter() - start))
+start = time.perf_counter()
+db = Database(logger, config)
+db.create_database()
+timings.append(("database", time.perf_counter() - start))
+start = time.perf_counter()
+db.set_coins(config.SUPPORTED_COIN_LIST)
+timings.append(("coins", time.perf_counter() - start))
+for name, duration in timings:
+    print(name, duration)
+"""
+
+
+def run(code: str, cwd: str):
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=cwd,
+        env=env,
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        universal_newlines=True,
+    ).stdout
+
+
+def time_import(module: str, cwd: str):
+    code = f"import time\nstart = time.perf_counter()\nimport {module}\nprint(time.perf_counter() - start)"
+    try:
+        return float(run(code, cwd))
+    except subprocess.CalledProcessError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import and initialization time of the bot")
+    parser.add_argument("-n", "--runs", type=int, default=5, help="runs per measurement, the best one is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as cwd:
+        # Initialization reads the same user.cfg as the bot, the environment is passed along as well
+        if os.path.exists(CFG_FL_NAME):
+            shutil.copy(CFG_FL_NAME, cwd)
+
+        # Every import is measured in a fresh interpreter, so nothing is cached from a previous measurement
+        print(f"Imports (best of {args.runs}):")
+        for module in IMPORTS:
+            timings = [time_import(module, cwd) for _ in range(args.runs)]
+            if None in timings:
+                print(f"  {module:<40} failed to import")
+                continue
+            print(f"  {module:<40} {min(timings) * 1000:8.1f}ms")
+
+        print(f"Initialization (best of {args.runs}):")
+        best = {}
+        for _ in range(args.runs):
+            # Measure a cold start, with the database created from scratch
+            db_path = os.path.join(cwd, "data", "crypto_trading.db")
+            if os.path.exists(db_path):
+                os.remove(db_path)
+            for line in run(INIT_SCRIPT, cwd).splitlines():
+                name, duration = line.split()
+                best[name] = min(best.get(name, float("inf")), float(duration))
+        for name, duration in best.items():
+            print(f"  {name:<40} {duration * 1000:8.1f}ms")
+
+        start = time.perf_counter()
+        try:
+            run("import binance_trade_bot.api_server", cwd)
+        except subprocess.CalledProcessError:
+            print("API server failed to import")
+        else:
+            print(f"API server cold start (interpreter included): {(time.perf_counter() - start) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
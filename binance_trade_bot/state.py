@@ -0,0 +1,139 @@
+import json
+import os
+import time
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from .binance_api_manager import BinanceAPIManager
+from .config import Config
+from .database import Database
+from .execution import JumpExecutor
+from .logger import Logger
+from .market import MarketPrices
+from .models import Coin, Pair, TradeState
+
+STATE_SNAPSHOT_PATH = "data/state_snapshot.json"
+STATE_SNAPSHOT_VERSION = 1
+
+# Tickers older than this are not trusted to initialize missing ratios
+MAX_TICKERS_AGE = 60
+
+
+class StateSnapshot:
+    """
+    Warm state written on shutdown and loaded on the next start, so a restart doesn't have to rebuild coins, pairs
+    and exchange info from scratch, and orders that were in flight are resumed instead of forgotten.
+    """
+
+    def __init__(self, logger: Logger, config: Config, path=STATE_SNAPSHOT_PATH):
+        self.logger = logger
+        self.config = config
+        self.path = path
+        self.state: Optional[dict] = None
+
+    def save(self, db: Database, manager: BinanceAPIManager, executor: JumpExecutor, prices: MarketPrices = None):
+        session: Session
+        with db.db_session() as session:
+            ratios = {f"{pair.from_coin_id}/{pair.to_coin_id}": pair.ratio for pair in session.query(Pair).all()}
+
+        state = {
+            "version": STATE_SNAPSHOT_VERSION,
+            "timestamp": time.time(),
+            "bridge": self.config.BRIDGE.symbol,
+            "supported_coin_list": self.config.SUPPORTED_COIN_LIST,
+            "tickers": prices.to_tickers() if prices is not None else None,
+            "ratios": ratios,
+            "symbol_info": manager.symbol_info,
+            "pending_orders": list(manager.pending_orders.values()),
+            "unfinished_buy": executor.unfinished_buy.symbol if executor.unfinished_buy is not None else None,
+        }
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+        self.logger.info(f"Saved state snapshot with {len(state['pending_orders'])} pending orders", False)
+
+    def load(self):
+        """
+        Load the snapshot written by the previous run, if it matches the current configuration. The file is removed
+        once read, so that a crash never brings back stale state.
+        """
+        if not os.path.isfile(self.path):
+            return False
+
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except ValueError:
+            self.logger.warning("State snapshot is corrupted, doing a cold start")
+            return False
+        finally:
+            os.remove(self.path)
+
+        if state.get("version") != STATE_SNAPSHOT_VERSION:
+            return False
+        if (
+            state["bridge"] != self.config.BRIDGE.symbol
+            or state["supported_coin_list"] != self.config.SUPPORTED_COIN_LIST
+        ):
+            self.logger.info("Configuration changed since the last run, doing a cold start")
+            return False
+
+        self.state = state
+        return True
+
+    def is_complete(self, db: Database):
+        """
+        Whether every pair between enabled coins already has a ratio in the snapshot, in which case coins, pairs and
+        thresholds don't need to be set up again
+        """
+        session: Session
+        with db.db_session() as session:
+            coins = [coin.symbol for coin in session.query(Coin).filter(Coin.enabled).all()]
+        if sorted(coins) != sorted(self.config.SUPPORTED_COIN_LIST):
+            return False
+        ratios = self.state["ratios"]
+        return all(
+            ratios.get(f"{from_coin}/{to_coin}") is not None
+            for from_coin in coins
+            for to_coin in coins
+            if from_coin != to_coin
+        )
+
+    def get_prices(self) -> Optional[MarketPrices]:
+        if (
+            self.state is None
+            or self.state["tickers"] is None
+            or time.time() - self.state["timestamp"] > MAX_TICKERS_AGE
+        ):
+            return None
+        return MarketPrices.from_tickers(self.state["tickers"], timestamp=self.state["timestamp"])
+
+    def restore(self, db: Database, manager: BinanceAPIManager, executor: JumpExecutor):
+        """
+        Restore the exchange info cache and reconcile the orders that were pending against Binance. Returns the
+        status of the buy order that was completed, if any, after setting its coin as the current one. A jump that
+        sold but didn't buy yet is handed back to the executor, which finishes it on the next scout.
+        """
+        manager.symbol_info.update(self.state["symbol_info"])
+
+        pending_orders = {pending["trade_id"]: pending for pending in self.state["pending_orders"]}
+        bought, unfinished_buy = manager.reconcile_pending_orders(pending_orders)
+        if bought is not None:
+            db.set_current_coin(bought["symbol"][: -len(self.config.BRIDGE.symbol)])
+        elif unfinished_buy is None:
+            # The sell went through before the bot stopped, and the buy failed or wasn't placed yet
+            unfinished_buy = self.state.get("unfinished_buy")
+        if unfinished_buy is not None:
+            self.logger.info(f"Resuming the jump to {unfinished_buy}, its sell went through but its buy didn't")
+            executor.unfinished_buy = db.get_coin(unfinished_buy)
+
+        trade = db.get_last_trade()
+        if trade is not None and trade.state == TradeState.ORDERED and trade.id not in pending_orders:
+            self.logger.warning(
+                f"Trade {trade.id} ({trade.alt_coin_id}/{trade.crypto_coin_id}) was interrupted and its order "
+                f"is unknown, please check it on Binance"
+            )
+        return bought
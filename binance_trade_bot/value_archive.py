@@ -0,0 +1,234 @@
+import math
+import os
+import struct
+from datetime import date, datetime, timedelta
+from itertools import groupby
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+EPOCH = datetime(1970, 1, 1)
+
+# (datetime, balance, usd_price, btc_price), missing prices are None
+ValuePoint = Tuple[datetime, float, Optional[float], Optional[float]]
+
+
+def _float_bits(value: Optional[float]) -> int:
+    return struct.unpack("<Q", struct.pack("<d", math.nan if value is None else value))[0]
+
+
+def _bits_float(bits: int) -> Optional[float]:
+    value = struct.unpack("<d", struct.pack("<Q", bits))[0]
+    return None if math.isnan(value) else value
+
+
+class _BitWriter:
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.length = 0
+
+    def write(self, value: int, bits: int):
+        self.chunks.append(format(value & ((1 << bits) - 1), f"0{bits}b"))
+        self.length += bits
+
+    def to_bytes(self) -> bytes:
+        padding = -self.length % 8
+        return int("".join(self.chunks) + "0" * padding or "0", 2).to_bytes((self.length + padding) // 8, "big")
+
+
+class _BitReader:
+    def __init__(self, data: bytes):
+        self.bits = format(int.from_bytes(data, "big"), f"0{len(data) * 8}b") if data else ""
+        self.position = 0
+
+    def read(self, bits: int) -> int:
+        value = int(self.bits[self.position : self.position + bits], 2)
+        self.position += bits
+        return value
+
+    def read_signed(self, bits: int) -> int:
+        value = self.read(bits)
+        return value - (1 << bits) if value >> (bits - 1) else value
+
+
+# Delta of delta timestamp buckets of Gorilla: (control bits, control bit count, value bits)
+TIMESTAMP_BUCKETS = ((0b10, 2, 7), (0b110, 3, 9), (0b1110, 4, 12))
+
+
+class _TimestampEncoder:
+    def __init__(self):
+        self.previous = None
+        self.delta = 0
+
+    def encode(self, writer: _BitWriter, timestamp: int):
+        if self.previous is None:
+            writer.write(timestamp, 64)
+            self.previous = timestamp
+            return
+        delta = timestamp - self.previous
+        delta_of_delta = delta - self.delta
+        self.previous, self.delta = timestamp, delta
+        if delta_of_delta == 0:
+            writer.write(0, 1)
+            return
+        for control, control_bits, bits in TIMESTAMP_BUCKETS:
+            if -(1 << (bits - 1)) <= delta_of_delta < 1 << (bits - 1):
+                writer.write(control, control_bits)
+                writer.write(delta_of_delta, bits)
+                return
+        writer.write(0b1111, 4)
+        writer.write(delta_of_delta, 64)
+
+    def decode(self, reader: _BitReader) -> int:
+        if self.previous is None:
+            self.previous = reader.read_signed(64)
+            return self.previous
+        delta_of_delta = 0
+        if reader.read(1):
+            for control_bits, bits in ((1, 7), (1, 9), (1, 12)):
+                if not reader.read(control_bits):
+                    delta_of_delta = reader.read_signed(bits)
+                    break
+            else:
+                delta_of_delta = reader.read_signed(64)
+        self.delta += delta_of_delta
+        self.previous += self.delta
+        return self.previous
+
+
+class _FloatEncoder:
+    """
+    XOR of each value with the previous one: a single bit when it didn't change, otherwise only the bits between
+    the leading and trailing zeros of the XOR, reusing the window of the previous value when they fit in it
+    """
+
+    def __init__(self):
+        self.previous = None
+        self.leading = self.trailing = None
+
+    def encode(self, writer: _BitWriter, value: Optional[float]):
+        bits = _float_bits(value)
+        if self.previous is None:
+            writer.write(bits, 64)
+            self.previous = bits
+            return
+        xor = bits ^ self.previous
+        self.previous = bits
+        if xor == 0:
+            writer.write(0, 1)
+            return
+        leading = min(64 - xor.bit_length(), 31)
+        trailing = (xor & -xor).bit_length() - 1
+        if self.leading is not None and leading >= self.leading and trailing >= self.trailing:
+            writer.write(0b10, 2)
+            writer.write(xor >> self.trailing, 64 - self.leading - self.trailing)
+            return
+        self.leading, self.trailing = leading, trailing
+        writer.write(0b11, 2)
+        writer.write(leading, 5)
+        writer.write(64 - leading - trailing - 1, 6)
+        writer.write(xor >> trailing, 64 - leading - trailing)
+
+    def decode(self, reader: _BitReader) -> Optional[float]:
+        if self.previous is None:
+            self.previous = reader.read(64)
+        elif reader.read(1):
+            if reader.read(1):
+                self.leading = reader.read(5)
+                self.trailing = 64 - self.leading - reader.read(6) - 1
+            self.previous ^= reader.read(64 - self.leading - self.trailing) << self.trailing
+        return _bits_float(self.previous)
+
+
+def encode_points(points: List[ValuePoint]) -> bytes:
+    """
+    Encode points ordered by time, with timestamps truncated to the second
+    """
+    writer = _BitWriter()
+    timestamps = _TimestampEncoder()
+    columns = [_FloatEncoder() for _ in range(3)]
+    for point in points:
+        timestamps.encode(writer, int((point[0] - EPOCH).total_seconds()))
+        for encoder, value in zip(columns, point[1:]):
+            encoder.encode(writer, value)
+    return struct.pack("<I", len(points)) + writer.to_bytes()
+
+
+def decode_points(data: bytes) -> Iterator[ValuePoint]:
+    (count,) = struct.unpack_from("<I", data)
+    reader = _BitReader(data[4:])
+    timestamps = _TimestampEncoder()
+    columns = [_FloatEncoder() for _ in range(3)]
+    for _ in range(count):
+        timestamp = EPOCH + timedelta(seconds=timestamps.decode(reader))
+        balance, usd_price, btc_price = (decoder.decode(reader) for decoder in columns)
+        yield timestamp, balance, usd_price, btc_price
+
+
+class ValueHistoryArchive:
+    """
+    Compressed archive of the value history, one file per coin and day. Timestamps are stored as deltas of deltas
+    and values as the XOR with the previous value of their column, which takes a few bits for a series sampled every
+    minute whose balance rarely changes, instead of a database row.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _day_path(self, coin: str, day: date):
+        return os.path.join(self.path, coin, f"{day.isoformat()}.bin")
+
+    def append(self, coin: str, points: Iterable[ValuePoint]):
+        """
+        Add points of a coin, merging them with the ones already archived for their days
+        """
+        for day, day_points in groupby(sorted(points, key=lambda point: point[0]), key=lambda point: point[0].date()):
+            path = self._day_path(coin, day)
+            merged = {point[0]: point for point in self._read_day(path)}
+            merged.update({point[0].replace(microsecond=0): point for point in day_points})
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Days are rewritten as a whole, don't leave a truncated one behind if that is interrupted
+            with open(path + ".tmp", "wb") as f:
+                f.write(encode_points([(timestamp, *point[1:]) for timestamp, point in sorted(merged.items())]))
+            os.replace(path + ".tmp", path)
+
+    def _read_day(self, path: str) -> Iterator[ValuePoint]:
+        if not os.path.isfile(path):
+            return iter(())
+        with open(path, "rb") as f:
+            return decode_points(f.read())
+
+    def coins(self) -> List[str]:
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(os.listdir(self.path))
+
+    def days(self, coin: str) -> List[date]:
+        coin_path = os.path.join(self.path, coin)
+        # The coin may come from a request, don't let it point anywhere else
+        if not coin.isalnum() or not os.path.isdir(coin_path):
+            return []
+        return sorted(
+            date.fromisoformat(name[: -len(".bin")]) for name in os.listdir(coin_path) if name.endswith(".bin")
+        )
+
+    def read(self, coin: str, start: datetime = None, end: datetime = None) -> Iterator[ValuePoint]:
+        """
+        Yield the archived points of a coin in order, only decoding the days between `start` and `end`
+        """
+        for day in self.days(coin):
+            if (start is not None and day < start.date()) or (end is not None and day > end.date()):
+                continue
+            for point in self._read_day(self._day_path(coin, day)):
+                if (start is None or point[0] >= start) and (end is None or point[0] < end):
+                    yield point
+
+    def last(self, coin: str) -> Optional[datetime]:
+        """
+        Time of the last archived point of a coin
+        """
+        days = self.days(coin)
+        if not days:
+            return None
+        timestamp = None
+        for timestamp, *_ in self._read_day(self._day_path(coin, days[-1])):
+            pass
+        return timestamp
@@ -0,0 +1,76 @@
+import pytest
+
+from binance_trade_bot.auto_trader import AutoTrader
+from binance_trade_bot.binance_api_manager import BinanceAPIManager
+from binance_trade_bot.config import Config
+from binance_trade_bot.database import Database
+from binance_trade_bot.logger import Logger
+from binance_trade_bot.simulator import ExchangeSimulator
+
+COINS = ["ADA", "BAT", "DOGE"]
+
+
+class LocalDatabase(Database):
+    # There is no API server to push updates to
+    def send_update(self, model):
+        pass
+
+    def send_updates(self, models: list):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    # The logger and the default data paths are relative to the working directory
+    (tmp_path / "logs").mkdir()
+    (tmp_path / "data").mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def config(workdir):
+    return Config(
+        str(workdir / "user.cfg"),
+        use_environment=False,
+        defaults={"api_key": "", "api_secret_key": "", "current_coin": "", "supported_coin_list": " ".join(COINS)},
+    )
+
+
+@pytest.fixture
+def logger():
+    return Logger("tests")
+
+
+@pytest.fixture
+def exchange(config):
+    return ExchangeSimulator(config.SUPPORTED_COIN_LIST, config.BRIDGE_SYMBOL, seed=1, weight_limit=None)
+
+
+@pytest.fixture
+def db(config, logger):
+    database = LocalDatabase(logger, config)
+    database.create_database()
+    database.set_coins(config.SUPPORTED_COIN_LIST)
+    return database
+
+
+@pytest.fixture
+def make_trader(config, logger, db, exchange):
+    """
+    Build a trader on the shared database and exchange, as the bot does on every start
+    """
+
+    def make():
+        manager = BinanceAPIManager(config, db, logger, binance_client=exchange)
+        return AutoTrader(manager, db, logger, config)
+
+    return make
+
+
+@pytest.fixture
+def trader(make_trader):
+    trader = make_trader()
+    trader.initialize_trade_thresholds()
+    trader.initialize_current_coin()
+    return trader
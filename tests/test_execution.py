@@ -0,0 +1,66 @@
+import threading
+
+
+def other_coin(config, db, coin):
+    return db.get_coin(next(symbol for symbol in config.SUPPORTED_COIN_LIST if symbol != coin.symbol))
+
+
+def test_jump_prepares_buy_while_selling(config, db, exchange, trader, monkeypatch):
+    from_coin = db.get_current_coin()
+    to_coin = other_coin(config, db, from_coin)
+
+    # Each side waits for the other to start, which times out unless they run side by side
+    preparing = threading.Event()
+    sell_placed = threading.Event()
+    overlapped = []
+    prepare_buy = trader.manager.prepare_buy
+    order_market_sell = exchange.order_market_sell
+
+    def prepare(*args):
+        preparing.set()
+        overlapped.append(sell_placed.wait(5))
+        return prepare_buy(*args)
+
+    def sell(*args, **kwargs):
+        overlapped.append(preparing.wait(5))
+        order = order_market_sell(*args, **kwargs)
+        sell_placed.set()
+        return order
+
+    monkeypatch.setattr(trader.manager, "prepare_buy", prepare)
+    monkeypatch.setattr(exchange, "order_market_sell", sell)
+    account_requests = exchange.requests["get_account"]
+
+    result = trader.executor.jump(from_coin, to_coin, trader.manager.get_market_prices())
+
+    assert result is not None and result["symbol"] == to_coin + config.BRIDGE_SYMBOL
+    assert overlapped == [True, True]
+    # One balance for the sell and one for preparing the buy, which is paid with what the sell is known to bring
+    assert exchange.requests["get_account"] - account_requests == 2
+    assert exchange.balances[to_coin.symbol] > 0
+    assert trader.executor.unfinished_buy is None
+    assert len(trader.executor.latencies) == 1
+
+
+def test_failed_buy_is_finished_on_next_scout(config, db, exchange, trader, monkeypatch):
+    from_coin = db.get_current_coin()
+    to_coin = other_coin(config, db, from_coin)
+
+    # buy_alt gives up once its retries are exhausted
+    buy_alt = trader.manager.buy_alt
+    monkeypatch.setattr(trader.manager, "buy_alt", lambda *args, **kwargs: None)
+    assert trader.executor.jump(from_coin, to_coin, trader.manager.get_market_prices()) is None
+    assert trader.executor.unfinished_buy.symbol == to_coin.symbol
+    assert exchange.balances[config.BRIDGE_SYMBOL] > 90
+
+    # Failing again keeps holding the bridge, without scouting for another jump
+    trader.scout()
+    assert trader.executor.unfinished_buy.symbol == to_coin.symbol
+    assert db.get_current_coin().symbol == from_coin.symbol
+
+    monkeypatch.setattr(trader.manager, "buy_alt", buy_alt)
+    trader.scout()
+    assert trader.executor.unfinished_buy is None
+    assert db.get_current_coin().symbol == to_coin.symbol
+    assert exchange.balances[to_coin.symbol] > 0
+    assert exchange.balances[config.BRIDGE_SYMBOL] < 1
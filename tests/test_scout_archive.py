@@ -0,0 +1,29 @@
+import os
+from datetime import datetime, timedelta
+
+from binance_trade_bot.scout_archive import ScoutHistoryArchive
+
+
+def rows(start: datetime, pair_ids):
+    return [(start + timedelta(minutes=i), pair_id, 1.0 + pair_id, 2.0, 3.0) for i, pair_id in enumerate(pair_ids)]
+
+
+def test_append_after_torn_append(workdir):
+    archive = ScoutHistoryArchive(str(workdir / "scout_history"))
+    start = datetime(2021, 3, 1, 12)
+    archive.append(rows(start, [1, 2, 3]))
+
+    # A crash in the middle of the next append wrote a row and a half of some columns only
+    day_path = os.path.join(archive.path, start.date().isoformat())
+    for name, extra in (("datetime", 12), ("pair_id", 4)):
+        with open(os.path.join(day_path, f"{name}.bin"), "ab") as f:
+            f.write(b"\x01" * extra)
+
+    archive.append(rows(start + timedelta(hours=1), [7, 8]))
+
+    with archive.read(start.date()) as day:
+        assert len(day) == 5
+        assert list(day["pair_id"]) == [1, 2, 3, 7, 8]
+        assert list(day["target_ratio"]) == [2.0, 3.0, 4.0, 8.0, 9.0]
+        archived = [datetime(1970, 1, 1) + timedelta(seconds=seconds) for seconds in day["datetime"]]
+        assert archived[3:] == [start + timedelta(hours=1), start + timedelta(hours=1, minutes=1)]
@@ -0,0 +1,48 @@
+import pytest
+
+from binance_trade_bot.models import Trade, TradeState
+from binance_trade_bot.state import StateSnapshot
+
+
+def interrupt_once(exchange, monkeypatch, endpoint):
+    """
+    Make the next call of `endpoint` stop the bot, like a SIGTERM would
+    """
+    call = getattr(exchange, endpoint)
+
+    def interrupted(*args, **kwargs):
+        monkeypatch.setattr(exchange, endpoint, call)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(exchange, endpoint, interrupted)
+
+
+# Stopped while waiting for the market sell, which Binance filled right away, or after it but before the buy got out
+@pytest.mark.parametrize("endpoint", ["get_order", "order_limit_buy"])
+def test_restart_between_sell_and_buy(
+    workdir, config, logger, db, exchange, trader, make_trader, monkeypatch, endpoint
+):  # pylint: disable=too-many-arguments
+    from_coin = db.get_current_coin()
+    to_coin = db.get_coin(next(symbol for symbol in config.SUPPORTED_COIN_LIST if symbol != from_coin.symbol))
+    snapshot = StateSnapshot(logger, config, str(workdir / "state.json"))
+
+    interrupt_once(exchange, monkeypatch, endpoint)
+    with pytest.raises(KeyboardInterrupt):
+        trader.executor.jump(from_coin, to_coin, trader.manager.get_market_prices())
+    snapshot.save(db, trader.manager, trader.executor)
+    # Only dust below the lot size is left of the sold coin
+    assert exchange.balances[config.BRIDGE_SYMBOL] > 90
+
+    restarted = make_trader()
+    assert snapshot.load()
+    snapshot.restore(db, restarted.manager, restarted.executor)
+    assert restarted.executor.unfinished_buy.symbol == to_coin.symbol
+    assert db.get_current_coin().symbol == from_coin.symbol
+
+    restarted.scout()
+    assert restarted.executor.unfinished_buy is None
+    assert db.get_current_coin().symbol == to_coin.symbol
+    assert exchange.balances[to_coin.symbol] > 0
+    with db.db_session() as session:
+        sells = session.query(Trade).filter(Trade.selling, Trade.alt_coin_id == from_coin.symbol).all()
+        assert [trade.state for trade in sells] == [TradeState.COMPLETE]
@@ -0,0 +1,60 @@
+import math
+import random
+from datetime import datetime, timedelta
+
+from binance_trade_bot.value_archive import decode_points, encode_points
+
+
+def roundtrip(points):
+    return list(decode_points(encode_points(points)))
+
+
+def test_roundtrip_minutely_series():
+    start = datetime(2021, 3, 1)
+    points = [(start + timedelta(minutes=i), 12.5, 1.0 + i / 1000, 0.00002 - i * 1e-9) for i in range(500)]
+    assert roundtrip(points) == points
+
+
+def test_roundtrip_irregular_timestamps():
+    # Every delta of delta bucket, up to gaps of days, and timestamps before the epoch
+    offsets = [0, 60, 120, 121, 300, 301, 2400, 2401, 200000, 200001, 200061, 200062, 1000000]
+    for start in (datetime(2021, 3, 1), datetime(1969, 12, 31, 23)):
+        points = [(start + timedelta(seconds=offset), 1.0, 2.0, 3.0) for offset in offsets]
+        assert roundtrip(points) == points
+
+
+def test_roundtrip_special_values():
+    start = datetime(2021, 3, 1)
+    values = [0.0, -0.0, -1.5, 1e-300, -1e300, 5e-324, math.inf, -math.inf, 123456.789, -0.000123]
+    points = [(start + timedelta(minutes=i), value, -value, value / 3) for i, value in enumerate(values)]
+    assert roundtrip(points) == points
+
+
+def test_missing_prices_are_none():
+    start = datetime(2021, 3, 1)
+    points = [
+        (start, 1.0, None, 2.0),
+        (start + timedelta(minutes=1), 1.0, 3.0, None),
+        (start + timedelta(minutes=2), 1.0, None, None),
+    ]
+    assert roundtrip(points) == points
+    # NaN is how missing prices are stored, so it comes back as one
+    assert roundtrip([(start, 1.0, math.nan, 2.0)]) == [(start, 1.0, None, 2.0)]
+
+
+def test_roundtrip_random_walk():
+    generator = random.Random(0)
+    start = datetime(2021, 3, 1)
+    points = []
+    timestamp, balance, price = start, 100.0, 0.5
+    for _ in range(1000):
+        timestamp += timedelta(seconds=generator.choice([60, 60, 60, 59, 61, 3600]))
+        if generator.random() < 0.05:
+            balance = -balance if generator.random() < 0.1 else balance * generator.uniform(0.5, 2)
+        price *= math.exp(generator.gauss(0, 0.01))
+        points.append((timestamp, balance, price, price / 40000 if generator.random() < 0.9 else None))
+    assert roundtrip(points) == points
+
+
+def test_empty():
+    assert roundtrip([]) == []